@@ -0,0 +1,39 @@
+"""
+compare indexing throughput of a local repository with different batch sizes.
+batch size 1 is equivalent to the old commit-per-commit write path.
+
+    python -m benchmarks.batch_size --repo /path/to/repo --batch_sizes 1,100,500
+
+each run uses a fresh database, a sqlite file in a temp directory unless
+BENCH_DATABASE_URL is set to a postgres url
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from loguru import logger
+
+from .common import time_indexing
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.batch_size")
+    parser.add_argument("--repo", required=True, help="path to a local git repository")
+    parser.add_argument("--batch_sizes", default="1,100,500", help="comma separated list of batch sizes")
+    options = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    repo_path = os.path.abspath(options.repo)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_url = os.environ.get("BENCH_DATABASE_URL", f"sqlite:///{tmp_dir}/bench.db")
+        print(f"{'batch_size':>10} {'commits':>8} {'seconds':>8} {'commits/sec':>12}")
+        for batch_size in [int(size) for size in options.batch_sizes.split(",")]:
+            n_commits, elapsed = time_indexing(repo_path, database_url, batch_size=batch_size)
+            print(f"{batch_size:>10} {n_commits:>8} {elapsed:>8.2f} {n_commits / max(elapsed, 0.001):>12,.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,37 @@
+import os
+from datetime import datetime
+
+from sqlalchemy import Engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy_utils import create_database, database_exists, drop_database
+
+from git_indexer.cli import create_sql_engine, run_alembic_command
+from git_indexer.commit_indexer import index_commits
+
+
+def create_fresh_database(database_url: str) -> Engine:
+    """drop and create the database, then run migrations"""
+    if database_exists(database_url):
+        drop_database(database_url)
+    create_database(database_url)
+
+    os.environ["DATABASE_URL"] = database_url
+    engine = create_sql_engine()
+    run_alembic_command("upgrade")
+    return engine
+
+
+def time_indexing(repo_path: str, database_url: str, **kwargs) -> tuple[int, float]:
+    """
+    index a local repository into a freshly created database,
+    returns the number of commits indexed and elapsed seconds
+    """
+    engine = create_fresh_database(database_url)
+
+    with sessionmaker(bind=engine)() as session:
+        start_t = datetime.now()
+        _, n_commits = index_commits(session, repo_path, local_repo_path=repo_path, repo_source="local", **kwargs)
+        elapsed = (datetime.now() - start_t).total_seconds()
+
+    engine.dispose()
+    return n_commits, elapsed
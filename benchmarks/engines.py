@@ -0,0 +1,44 @@
+"""
+compare indexing throughput of the pydriller and gitlog engines on a local repository,
+with --pipeline each engine is also run with extraction and writes in separate threads
+
+    python -m benchmarks.engines --repo /path/to/repo [--pipeline]
+
+each run uses a fresh database, a sqlite file in a temp directory unless
+BENCH_DATABASE_URL is set to a postgres url
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from loguru import logger
+
+from git_indexer.commit_indexer import ENGINES
+
+from .common import time_indexing
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.engines")
+    parser.add_argument("--repo", required=True, help="path to a local git repository")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="comma separated list of engines")
+    parser.add_argument("--pipeline", action="store_true", default=False, help="also run each engine pipelined")
+    options = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    repo_path = os.path.abspath(options.repo)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_url = os.environ.get("BENCH_DATABASE_URL", f"sqlite:///{tmp_dir}/bench.db")
+        print(f"{'engine':>20} {'commits':>8} {'seconds':>8} {'commits/sec':>12}")
+        for engine in options.engines.split(","):
+            for pipeline in [False, True] if options.pipeline else [False]:
+                n_commits, elapsed = time_indexing(repo_path, database_url, engine=engine, pipeline=pipeline)
+                name = f"{engine}+pipeline" if pipeline else engine
+                print(f"{name:>20} {n_commits:>8} {elapsed:>8.2f} {n_commits / max(elapsed, 0.001):>12,.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,68 @@
+"""
+compare matching file paths against the exclude patterns one regex at a time,
+with the combined regex and with the combined regex and memoization
+
+    python -m benchmarks.exclusions [--n_paths 3000000] [--repo /path/to/repo]
+
+paths are drawn from the files in the history of --repo when given, otherwise from
+synthetic source trees. a few files get most of the changes, like in real repositories
+"""
+import argparse
+import random
+import re
+import subprocess
+import sys
+from datetime import datetime
+from typing import Callable
+
+from git_indexer.exclusions import DEFAULT_EXCLUDE_PATTERNS, PathExcluder
+
+_DIRS_ = ["src/main/java/com/company/app", "app/components", "web", "Pods/Firebase", "vendor/github.com/lib", "lib"]
+_FILES_ = ["Application.java", "index.js", "_mixins.scss", "package-lock.json", "go.sum", "logo.png", "README.md"]
+
+
+def synthetic_paths(n_files: int) -> list[str]:
+    rnd = random.Random(42)
+    return [f"{rnd.choice(_DIRS_)}/module{i % 97}/{i}_{rnd.choice(_FILES_)}" for i in range(n_files)]
+
+
+def repo_paths(repo_path: str) -> list[str]:
+    out = subprocess.run(
+        ["git", "log", "--all", "--name-only", "--format="], cwd=repo_path, capture_output=True, text=True, check=True
+    ).stdout
+    return sorted({line for line in out.splitlines() if line})
+
+
+def time_matching(paths: list[str], is_excluded: Callable[[str], bool]) -> tuple[int, float]:
+    start_t = datetime.now()
+    n_excluded = sum(1 for path in paths if is_excluded(path))
+    return n_excluded, (datetime.now() - start_t).total_seconds()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.exclusions")
+    parser.add_argument("--n_paths", type=int, default=3_000_000, help="number of paths to match")
+    parser.add_argument("--repo", help="path to a local git repository to take paths from")
+    options = parser.parse_args(argv)
+
+    files = repo_paths(options.repo) if options.repo else synthetic_paths(50_000)
+    # pareto distributed picks, most paths are one of a small number of files
+    rnd = random.Random(42)
+    paths = [files[min(int(rnd.paretovariate(1.2)) - 1, len(files) - 1)] for _ in range(options.n_paths)]
+    print(f"matching {len(paths):,} paths, {len(set(paths)):,} distinct")
+
+    regexes = [re.compile(pattern) for pattern in DEFAULT_EXCLUDE_PATTERNS]
+    matchers = {
+        "separate regexes": lambda path: any(regex.match(path) for regex in regexes),
+        "combined regex": PathExcluder(DEFAULT_EXCLUDE_PATTERNS, cache_size=0).is_excluded,
+        "combined + memo": PathExcluder(DEFAULT_EXCLUDE_PATTERNS).is_excluded,
+    }
+
+    print(f"{'matcher':>20} {'excluded':>10} {'seconds':>8} {'paths/sec':>12}")
+    for name, is_excluded in matchers.items():
+        n_excluded, elapsed = time_matching(paths, is_excluded)
+        print(f"{name:>20} {n_excluded:>10,} {elapsed:>8.2f} {len(paths) / max(elapsed, 0.001):>12,.0f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,177 @@
+"""
+run the indexing pipeline against a synthetic repository and save the results as json
+
+    python -m benchmarks.suite --commits 10000 --branches 4 --giant_commits 2 --output results.json
+    python -m benchmarks.suite --commits 10000 --output new.json --baseline results.json
+
+the stages are mirror (git clone --mirror), index (index_commits into a fresh database),
+refetch and reindex (a fetch and an index run that find nothing new) and search (the
+queries of the git_search app). each stage reports elapsed seconds, throughput and the
+resident memory after it, peak_rss_mb is the peak of the whole run. with --baseline,
+the elapsed seconds of each stage are compared with those of a previous result file.
+git clones a local repository with hardlinks, mirror timings are a lower bound
+
+the database is a sqlite file in a temp directory unless BENCH_DATABASE_URL is set
+to a postgres url
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from typing import Any
+
+from loguru import logger
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from git_indexer.commit_indexer import ENGINES, index_commits
+from git_indexer.mirror import mirror_repo
+from git_indexer.models import Commit, CommittedFile, repo_to_commit_table
+from git_indexer.utils import rss_mb
+
+from .common import create_fresh_database
+from .synthetic import SyntheticRepoSpec, create_synthetic_repo
+
+_N_SEARCHES_ = 20
+
+
+def run_suite(work_dir: str, database_url: str, spec: SyntheticRepoSpec, **index_args) -> list[dict[str, Any]]:
+    repo_path = f"{work_dir}/origin/synthetic.git"
+    mirror_path = f"{work_dir}/mirror"
+    stages = []
+
+    start_t = datetime.now()
+    create_synthetic_repo(repo_path, spec)
+    stages.append(_stage_("generate", _since_(start_t), commits=spec.commits))
+
+    start_t = datetime.now()
+    local_repo_path, _ = mirror_repo(repo_path, "local", False, mirror_path)
+    stages.append(_stage_("mirror", _since_(start_t), commits=spec.commits))
+    if local_repo_path is None:
+        raise RuntimeError(f"unable to mirror {repo_path}")
+
+    engine = create_fresh_database(database_url)
+    with sessionmaker(bind=engine)() as session:
+        start_t = datetime.now()
+        _, n_commits = index_commits(session, repo_path, local_repo_path, "local", **index_args)
+        elapsed = _since_(start_t)
+        stages.append(_stage_("index", elapsed, commits=n_commits, rows=_count_rows_(session)))
+
+        start_t = datetime.now()
+        mirror_repo(repo_path, "local", False, mirror_path)
+        stages.append(_stage_("refetch", _since_(start_t)))
+
+        start_t = datetime.now()
+        _, n_commits = index_commits(session, repo_path, local_repo_path, "local", **index_args)
+        stages.append(_stage_("reindex", _since_(start_t), commits=n_commits))
+
+        sha = session.scalar(select(Commit.sha).limit(1))
+    engine.dispose()
+
+    # imported here, the app reads DATABASE_URL and reconfigures the logger on import
+    import git_search
+
+    logger.remove()
+    queries = [("sha", sha[:10]), ("email", "dev1@example.com"), ("repo", "synthetic")]  # type: ignore
+    start_t = datetime.now()
+    for _ in range(_N_SEARCHES_):
+        for mode, query in queries:
+            git_search.search_commits(mode, query)
+    stages.append(_stage_("search", _since_(start_t), queries=_N_SEARCHES_ * len(queries)))
+
+    return stages
+
+
+def _since_(start_t: datetime) -> float:
+    return (datetime.now() - start_t).total_seconds()
+
+
+def _stage_(name: str, elapsed: float, **counts: int) -> dict[str, Any]:
+    stage: dict[str, Any] = {"stage": name, "seconds": round(elapsed, 3), **counts}
+    for what, count in counts.items():
+        stage[f"{what}_per_sec"] = round(count / max(elapsed, 0.001), 1)
+    stage["rss_mb"] = round(rss_mb(), 1)
+    return stage
+
+
+def _count_rows_(session: Session) -> int:
+    return sum(
+        session.scalar(select(func.count()).select_from(table))
+        for table in [Commit.__table__, CommittedFile.__table__, repo_to_commit_table]
+    )
+
+
+def _git_version_() -> str:
+    # the version of git_indexer being benchmarked
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=cwd, capture_output=True, text=True)
+    return process.stdout.strip()
+
+
+def _compare_(stages: list[dict[str, Any]], baseline_file: str) -> None:
+    with open(baseline_file, "r") as f:
+        baseline = {stage["stage"]: stage for stage in json.load(f)["stages"]}
+
+    print(f"\ncompared with {baseline_file}")
+    print(f"{'stage':>10} {'baseline':>10} {'seconds':>10} {'change':>8}")
+    for stage in stages:
+        old = baseline.get(stage["stage"])
+        if old is not None:
+            change = (stage["seconds"] - old["seconds"]) / max(old["seconds"], 0.001)
+            print(f"{stage['stage']:>10} {old['seconds']:>10.2f} {stage['seconds']:>10.2f} {change:>+8.1%}")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite")
+    for name, default in SyntheticRepoSpec().as_dict().items():
+        parser.add_argument(f"--{name}", type=int, default=default, help=f"synthetic repository {name}")
+    parser.add_argument("--engine", choices=ENGINES, default="gitlog")
+    parser.add_argument("--batch_size", type=int, default=500)
+    parser.add_argument("--pipeline", action="store_true", default=False)
+    parser.add_argument("--output", default="benchmark_results.json", help="json file to write results to")
+    parser.add_argument("--baseline", help="json file of a previous run to compare with")
+    options = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    spec = SyntheticRepoSpec(**{name: getattr(options, name) for name in SyntheticRepoSpec().as_dict()})
+    index_args = {"engine": options.engine, "batch_size": options.batch_size, "pipeline": options.pipeline}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_url = os.environ.get("BENCH_DATABASE_URL", f"sqlite:///{tmp_dir}/bench.db")
+        stages = run_suite(tmp_dir, database_url, spec, **index_args)
+
+    result = {
+        "version": _git_version_(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "database": database_url.split(":")[0],
+        "repo": spec.as_dict(),
+        "options": index_args,
+        "stages": stages,
+        # kilobytes on linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    with open(options.output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"{'stage':>10} {'seconds':>8} {'commits/sec':>12} {'rows/sec':>12} {'rss_mb':>8}")
+    for stage in stages:
+        print(
+            f"{stage['stage']:>10} {stage['seconds']:>8.2f} {stage.get('commits_per_sec', ''):>12} "
+            f"{stage.get('rows_per_sec', ''):>12} {stage['rss_mb']:>8}"
+        )
+    print(f"peak rss {result['peak_rss_mb']:,} MB, results written to {options.output}")
+
+    if options.baseline:
+        _compare_(stages, options.baseline)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
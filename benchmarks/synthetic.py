@@ -0,0 +1,99 @@
+"""
+generate a synthetic git repository of a given size with git fast-import
+
+    python -m benchmarks.synthetic --dest /tmp/synthetic --commits 10000 --branches 4
+
+commits are spread round robin over the branches, every branch other than main
+forks from main. giant commits, e.g. a vendored dependency or a code formatter run,
+touch giant_files files each and are spread evenly over the history
+"""
+import argparse
+import os
+import subprocess
+import sys
+from dataclasses import asdict, dataclass
+from typing import IO
+
+_EXTENSIONS_ = ["java", "py", "js", "go", "md", "yaml", "kt", "swift"]
+_N_AUTHORS_ = 50
+_START_TS_ = 1_600_000_000
+
+
+@dataclass
+class SyntheticRepoSpec:
+    commits: int = 1000
+    files_per_commit: int = 5
+    # distinct files modified by regular commits
+    files: int = 2000
+    branches: int = 1
+    giant_commits: int = 0
+    giant_files: int = 5000
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def create_synthetic_repo(repo_path: str, spec: SyntheticRepoSpec) -> None:
+    """create a git repository in repo_path, which must not exist yet"""
+    os.makedirs(repo_path)
+    subprocess.run(["git", "init", "--quiet", "--bare", "--initial-branch", "main"], cwd=repo_path, check=True)
+    process = subprocess.Popen(["git", "fast-import", "--quiet"], cwd=repo_path, stdin=subprocess.PIPE)
+    try:
+        _write_stream_(process.stdin, spec)  # type: ignore
+    finally:
+        process.stdin.close()  # type: ignore
+    if process.wait() != 0:
+        raise RuntimeError(f"git fast-import returned code {process.returncode}")
+
+
+def _write_stream_(out: IO[bytes], spec: SyntheticRepoSpec) -> None:
+    branches = ["main"] + [f"feature/{i}" for i in range(1, spec.branches)]
+    # mark of the last commit on each branch
+    tips: dict[str, int] = {}
+    giant_every = spec.commits // spec.giant_commits if spec.giant_commits else 0
+
+    for i in range(spec.commits):
+        mark = i + 1
+        branch = branches[i % len(branches)]
+        author = i % _N_AUTHORS_
+        is_giant = giant_every > 0 and i % giant_every == giant_every - 1
+        msg = f"{'giant' if is_giant else 'synthetic'} commit {i}\n".encode()
+
+        out.write(f"commit refs/heads/{branch}\nmark :{mark}\n".encode())
+        out.write(f"committer Dev {author} <dev{author}@example.com> {_START_TS_ + i * 60} +0000\n".encode())
+        out.write(b"data %d\n%s" % (len(msg), msg))
+        parent = tips.get(branch, tips.get("main"))
+        if parent is not None:
+            out.write(f"from :{parent}\n".encode())
+
+        paths = (
+            [f"vendor/lib{file_no // 100}/file{file_no}.go" for file_no in range(spec.giant_files)]
+            if is_giant
+            else [_file_path_((i * spec.files_per_commit + j) % spec.files) for j in range(spec.files_per_commit)]
+        )
+        for path in paths:
+            content = f"// {path}\nline changed in commit {i}\n" + "unchanged line\n" * 10
+            out.write(b"M 100644 inline %s\ndata %d\n%s\n" % (path.encode(), len(content), content.encode()))
+
+        out.write(b"\n")
+        tips[branch] = mark
+
+
+def _file_path_(file_no: int) -> str:
+    extension = _EXTENSIONS_[file_no % len(_EXTENSIONS_)]
+    return f"src/module{file_no % 37}/pkg{file_no % 11}/file{file_no}.{extension}"
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.synthetic")
+    parser.add_argument("--dest", required=True, help="path of the repository to create")
+    for name, default in SyntheticRepoSpec().as_dict().items():
+        parser.add_argument(f"--{name}", type=int, default=default)
+    options = vars(parser.parse_args(argv))
+
+    dest = options.pop("dest")
+    create_synthetic_repo(dest, SyntheticRepoSpec(**options))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
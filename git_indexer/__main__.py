@@ -6,12 +6,26 @@ from loguru import logger
 
 from .cli import main
 
+LOG_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | "
+    "{process.name} | {extra[repo]} | <level>{message}</level>"
+)
+
 if __name__ == "__main__":
     load_dotenv()
 
     logger.remove()
     log_file = os.environ.get("LOG_FILE")
     log_level = os.environ.get("LOG_LEVEL", "INFO")
-    logger.add(log_file if log_file else sys.stdout, level=log_level)  # type: ignore
+    # the repo being processed is added to each line, so that output from
+    # multiple worker processes can be told apart. enqueue makes the sink
+    # safe to use from worker processes
+    logger.configure(extra={"repo": "-"})
+    logger.add(
+        log_file if log_file else sys.stdout,  # type: ignore
+        level=log_level,
+        format=LOG_FORMAT,
+        enqueue=True,
+    )
 
     main(argv=sys.argv[1:])
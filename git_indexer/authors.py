@@ -0,0 +1,69 @@
+from collections import OrderedDict
+
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .models import Author
+
+DEFAULT_AUTHOR_CACHE_SIZE = 10000
+
+
+class AuthorCache:
+    """
+    bounded email => author id cache, least recently used entries are
+    evicted first. one cache is meant to be used for all repositories
+    in a run, most commits come from a small number of committers.
+
+    emails are expected to be in lower case
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_AUTHOR_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits, self.misses = 0, 0
+        self._ids: OrderedDict[str, int] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def warm(self, session: Session) -> None:
+        """load up to maxsize existing authors with a single query"""
+        for email, author_id in session.execute(select(Author.email, Author.id).limit(self.maxsize)):
+            self._put_(email, author_id)
+        logger.debug(f"loaded {len(self._ids):,} authors into cache")
+
+    def author_id(self, session: Session, email: str, name: str) -> int:
+        """
+        returns the id of the author with the email, creates a new author if
+        none exists. a new author is committed right away, if another process
+        inserts the same email first the unique index on email rejects
+        our insert and the id of the other author is used
+        """
+        author_id = self._ids.get(email)
+        if author_id is not None:
+            self.hits += 1
+            self._ids.move_to_end(email)
+            return author_id
+
+        self.misses += 1
+        author_id = session.scalar(select(Author.id).where(Author.email == email))
+        if author_id is None:
+            try:
+                author = Author(name=name, email=email)
+                session.add(author)
+                session.commit()
+                author_id = author.id
+            except IntegrityError:
+                session.rollback()
+                logger.debug(f"author {email} was created by another process")
+                author_id = session.scalar(select(Author.id).where(Author.email == email))
+
+        self._put_(email, author_id)  # type: ignore
+        return author_id  # type: ignore
+
+    def _put_(self, email: str, author_id: int) -> None:
+        self._ids[email] = author_id
+        self._ids.move_to_end(email)
+        if len(self._ids) > self.maxsize:
+            self._ids.popitem(last=False)
@@ -1,21 +1,45 @@
 import argparse
 import os
+import time
+import traceback
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Iterator, Optional
 
 from alembic import command
 from alembic.config import Config
 from loguru import logger
-from sqlalchemy import Engine, create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import Engine, create_engine, func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, sessionmaker
 
-from .commit_indexer import index_commits
-from .mirror import mirror_repo
+from . import metrics
+from .authors import AuthorCache
+from .code_metrics import index_code_metrics, is_valid_policy
+from .commit_indexer import ENGINES, index_commits
+from .gitlog import repo_size
+from .maintenance import (
+    DEFAULT_INTERVAL_DAYS,
+    DEFAULT_MAX_PACKS,
+    is_maintenance_due,
+    maintain_mirror,
+)
+from .mirror import MIRROR_REFSPECS, mirror_repo
+from .mirror_manifest import evict_mirrors, update_manifest
+from .models import IndexCheckpoint
+from .profiling import RepoProfile, cprofile_to, log_profile_summary, timed
 from .request_indexer import index_merge_requests
+from .run_history import finish_run, print_report, record_repo_run, start_run
+from .scheduler import HostLimitedExecutor, repo_host
+from .shared_objects import share_with_origin
 from .utils import (
+    clone_url2mirror_path,
+    display_url,
     enumberate_from_file,
     enumerate_github_repos,
     enumerate_gitlab_repos,
     match_any,
 )
+from .writer import DEFAULT_BATCH_SIZE
 
 
 def parse_options(argv):
@@ -24,7 +48,7 @@ def parse_options(argv):
         "--all",
         action="store_true",
         default=False,
-        help="index all commits, not just ones since last_indexed_at",
+        help="traverse all commits, not just ones added since the ref tips indexed last time",
     )
     parser.add_argument(
         "--filter",
@@ -40,15 +64,18 @@ def parse_options(argv):
     )
     parser.add_argument(
         "--mode",
-        choices=["commits", "requests", "mirror"],
+        choices=["commits", "requests", "mirror", "metrics", "maintain", "report"],
         required=True,
-        help="Index commits or merge/pull requests or just mirror repos without indexing",
+        help="Index commits or merge/pull requests or just mirror repos without indexing. "
+        "metrics computes code metrics of commits indexed without them. "
+        "maintain writes commit-graphs and repacks existing mirrors. "
+        "report lists the slowest and fastest growing repositories of recent runs",
     )
     parser.add_argument(
         "--source",
         choices=["github", "gitlab", "list"],
-        required=True,
-        help="The source to get repos from",
+        required=False,
+        help="The source to get repos from, required except when mode is report",
     )
     parser.add_argument(
         "--mirror_path",
@@ -57,17 +84,192 @@ def parse_options(argv):
         default="",
         help="local path to store mirrors of remote repos",
     )
+    parser.add_argument(
+        "--batch_size",
+        dest="batch_size",
+        type=int,
+        required=False,
+        default=DEFAULT_BATCH_SIZE,
+        help="number of new commits to buffer before writing to database",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        required=False,
+        default="pydriller",
+        help="engine used to extract commits. gitlog is faster but does not compute code metrics",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        default=False,
+        help="extract commits from git in a separate thread while writing to database",
+    )
+    parser.add_argument(
+        "--max_memory_mb",
+        type=int,
+        required=False,
+        default=0,
+        help="stop indexing a repository after the current batch when memory used goes beyond this, "
+        "the next run resumes from there. 0 for no limit",
+    )
+    parser.add_argument(
+        "--code_metrics",
+        dest="code_metrics",
+        required=False,
+        default="all",
+        help="when to compute code metrics: all, off, deferred to --mode metrics, "
+        "or a comma separated list of file types, e.g. java,py",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=False,
+        help="time the stages of processing each repository and log the slowest repositories and stages",
+    )
+    parser.add_argument(
+        "--profile_dir",
+        required=False,
+        default="",
+        help="save cProfile stats of each repository to a file in this directory, implies --profile",
+    )
+    parser.add_argument(
+        "--metrics_file",
+        required=False,
+        default="",
+        help="write metrics of the run in prometheus text format to this file at the end of the run",
+    )
+    parser.add_argument(
+        "--metrics_port",
+        type=int,
+        required=False,
+        default=0,
+        help="serve metrics in prometheus text format on http://0.0.0.0:port/metrics during the run",
+    )
+    parser.add_argument(
+        "--report_days",
+        type=int,
+        required=False,
+        default=30,
+        help="number of days of runs included in the report",
+    )
+    parser.add_argument(
+        "--report_limit",
+        type=int,
+        required=False,
+        default=10,
+        help="number of repositories in each list of the report",
+    )
+    parser.add_argument(
+        "--max_per_host",
+        type=int,
+        required=False,
+        default=0,
+        help="max number of repositories from the same host processed at the same time by workers, 0 for no limit",
+    )
+    parser.add_argument(
+        "--mirror_retries",
+        type=int,
+        required=False,
+        default=2,
+        help="number of times a failed clone or fetch of a mirror is retried, with exponential backoff",
+    )
+    parser.add_argument(
+        "--mirror_refs",
+        choices=list(MIRROR_REFSPECS),
+        required=False,
+        default="all",
+        help="refs fetched into mirrors, branches skips pull and merge request refs. applies to existing mirrors too",
+    )
+    parser.add_argument(
+        "--maintain_interval_days",
+        type=float,
+        required=False,
+        default=DEFAULT_INTERVAL_DAYS,
+        help="days between maintenance of a mirror in maintain mode, 0 to maintain all mirrors now",
+    )
+    parser.add_argument(
+        "--max_packs",
+        type=int,
+        required=False,
+        default=DEFAULT_MAX_PACKS,
+        help="number of packs above which maintain mode repacks a mirror into one pack",
+    )
+    parser.add_argument(
+        "--shared_objects",
+        action="store_true",
+        default=False,
+        help="in maintain mode, make mirrors of forks borrow objects from the mirror of an indexed repository "
+        "they share commits with, see shared_objects.py",
+    )
+    parser.add_argument(
+        "--always_fetch",
+        action="store_true",
+        default=False,
+        help="fetch existing mirrors even when git ls-remote shows no ref changed since the last fetch",
+    )
+    parser.add_argument(
+        "--mirror_budget_gb",
+        type=float,
+        required=False,
+        default=0,
+        help="disk budget of the mirrors in GB, the least recently used mirrors are removed at the end "
+        "of a run to fit, inactive repositories first. 0 for no limit",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        required=False,
+        default=1,
+        help="number of worker processes used to mirror and index repositories in parallel, threads in mirror mode",
+    )
 
     ns = parser.parse_args(argv)
 
-    if ns.mode != "requests" and ns.mirror_path == "":
+    if ns.mode != "report" and ns.source is None:
+        parser.error("--source is required except when mode is report")
+
+    if ns.mode not in ["requests", "report"] and ns.mirror_path == "":
         parser.error("--mirror_path is required except when mode is reuqests")
 
+    if ns.batch_size < 1:
+        parser.error("--batch_size must be at least 1")
+
+    if ns.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    if ns.max_per_host < 0:
+        parser.error("--max_per_host must not be negative")
+
+    if ns.mirror_budget_gb < 0:
+        parser.error("--mirror_budget_gb must not be negative")
+
+    if ns.mirror_retries < 0:
+        parser.error("--mirror_retries must not be negative")
+
+    if ns.max_memory_mb < 0:
+        parser.error("--max_memory_mb must not be negative")
+
+    if not is_valid_policy(ns.code_metrics):
+        parser.error("--code_metrics must be all, off, deferred or a list of file types")
+
+    ns.profile = ns.profile or bool(ns.profile_dir)
+
     return ns
 
 
 def handle_options(options: argparse.Namespace, engine: Engine) -> None:
     logger.info(f"started command with: {options}")
+    if options.mode == "commits" and options.engine == "gitlog" and options.code_metrics not in ["off", "deferred"]:
+        logger.warning(
+            f"the gitlog engine does not compute code metrics, --code_metrics {options.code_metrics} is deferred"
+            " to a later run of --mode metrics"
+        )
+
+    if options.mode == "report":
+        with sessionmaker(bind=engine)() as report_session:
+            print_report(report_session, days=options.report_days, limit=options.report_limit)
+        return
 
     if options.source == "gitlab":
         enumerator = enumerate_gitlab_repos
@@ -79,60 +281,358 @@ def handle_options(options: argparse.Namespace, engine: Engine) -> None:
         logger.info(f"unknown source: {options.source}")
         return
 
-    session = None
+    if options.metrics_port:
+        metrics.serve_metrics(options.metrics_port)
+
+    start_t = time.time()
+    session: Optional[Session] = None
+    run_id, outcome = None, "failed"
     try:
-        Session = sessionmaker(bind=engine)
-        session = Session()
-
-        for repo_url, project in enumerator(options.query):
-            if match_any(repo_url, options.filter):
-                if options.source == "list":
-                    repo_source = project["repo_source"]
-                    is_private_repo = project["is_private"]
-                    is_remote_repo = project["is_remote"]
-                elif options.source == "gitlab":
-                    is_private_repo = project.visibility == "private"
-                    is_remote_repo = True
-                    repo_source = "gitlab"
-                elif options.source == "github":
-                    is_private_repo = project.private
-                    is_remote_repo = True
-                    repo_source = "github"
-
-                if options.mode == "requests":
-                    if repo_source in ["gitlab", "github"]:
-                        index_merge_requests(session, repo_source, project)
-                    else:
-                        logger.info(f"unknown repo_source: {repo_source} for {repo_url}")
-
-                elif options.mode in ["commits", "mirror"]:
-                    if is_remote_repo:
-                        # create a local mirror of a remote repo
-                        local_repo_path, _ = mirror_repo(
-                            repo_url,
-                            repo_source=options.source,
-                            is_private_repo=is_private_repo,
-                            dest_path=options.mirror_path,
-                        )
-                        if local_repo_path is None:
-                            logger.warning(f"cannot create mirror for {repo_url}")
-                            continue
-                    else:
-                        local_repo_path = repo_url
-
-                    if options.mode == "commits":
-                        index_commits(
-                            session,
-                            repo_url,
-                            repo_source=repo_source,
-                            local_repo_path=local_repo_path,
-                            index_all=options.all,
-                        )
-                else:
-                    logger.info(f"unknown mode: {options.mode}")
+        session = sessionmaker(bind=engine)()
+        run_id = start_run(session, options)
+
+        if options.workers > 1 and options.mode in ["commits", "mirror", "metrics", "maintain"]:
+            _handle_repos_in_pool_(options, enumerator, session, run_id)
+        else:
+            _handle_repos_(options, enumerator, session, run_id)
+        if options.mirror_budget_gb and options.mode in ["commits", "mirror", "metrics", "maintain"]:
+            evict_mirrors(session, int(options.mirror_budget_gb * 2**30), options.mirror_path)
+        outcome = "completed"
+    except Exception as e:
+        metrics.ERRORS.inc(stage="run", type=type(e).__name__)
+        raise
     finally:
-        if session:
+        if session is not None:
+            if run_id is not None:
+                session.rollback()
+                finish_run(session, run_id, outcome)
             session.close()
+        _export_metrics_(options, engine, start_t)
+
+
+def _handle_repos_(options: argparse.Namespace, enumerator: Callable, session: Session, run_id: int) -> None:
+    profiles = []
+    author_cache = AuthorCache()
+    if options.mode == "commits":
+        author_cache.warm(session)
+
+    for repo, enumerate_seconds in timed(_repos_to_index_(options, enumerator)):
+        repo_url, project, repo_source, is_private_repo, is_remote_repo = repo
+        with logger.contextualize(repo=display_url(repo_url)):
+            if options.mode == "requests":
+                if repo_source in ["gitlab", "github"]:
+                    index_merge_requests(session, repo_source, project)
+                    metrics.REPOS_PROCESSED.inc(mode=options.mode)
+                else:
+                    logger.info(f"unknown repo_source: {repo_source} for {repo_url}")
+
+            elif options.mode in ["commits", "mirror", "metrics", "maintain"]:
+                profile = RepoProfile(repo_url)
+                profile.add("enumerate", enumerate_seconds)
+                profiles.append(profile)
+                try:
+                    index_repository(
+                        session, options, repo_url, repo_source, is_private_repo, is_remote_repo, author_cache, profile
+                    )
+                except Exception as e:
+                    exc = traceback.format_exc()
+                    logger.warning(f"Exception processing repository {display_url(repo_url)} => {str(e)}\n{exc}")
+                    metrics.ERRORS.inc(stage="repository", type=type(e).__name__)
+                    profile.failed(e)
+                    session.rollback()
+                record_repo_run(session, run_id, profile)
+                update_manifest(session, options.mirror_path, options.mode, profile)
+            else:
+                logger.info(f"unknown mode: {options.mode}")
+
+    if options.profile:
+        log_profile_summary(profiles)
+
+
+def _repos_to_index_(options: argparse.Namespace, enumerator: Callable) -> Iterator[tuple[str, Any, str, bool, bool]]:
+    """
+    enumerate repos matching the filter, returns a tuple of
+    repo_url, project, repo_source, is_private_repo, is_remote_repo
+    """
+    for repo_url, project in enumerator(options.query):
+        if match_any(repo_url, options.filter):
+            if options.source == "list":
+                repo_source = project["repo_source"]
+                is_private_repo = project["is_private"]
+                is_remote_repo = project["is_remote"]
+            elif options.source == "gitlab":
+                is_private_repo = project.visibility == "private"
+                is_remote_repo = True
+                repo_source = "gitlab"
+            elif options.source == "github":
+                is_private_repo = project.private
+                is_remote_repo = True
+                repo_source = "github"
+
+            yield repo_url, project, repo_source, is_private_repo, is_remote_repo
+
+
+def index_repository(
+    session: Session | None,
+    options: argparse.Namespace,
+    repo_url: str,
+    repo_source: str,
+    is_private_repo: bool,
+    is_remote_repo: bool,
+    author_cache: AuthorCache | None = None,
+    profile: RepoProfile | None = None,
+) -> int:
+    """
+    mirror a remote repo if needed, then index its commits when mode is commits.
+    when mode is metrics, compute code metrics using the existing mirror.
+    when mode is maintain, write the commit-graph and repack the existing mirror if due.
+    time spent in each stage is added to profile when given.
+    session is only used to index, it can be None when mode is mirror.
+    returns the number of new commits indexed, or commits updated with code metrics
+    """
+    if profile is None:
+        profile = RepoProfile(repo_url)
+
+    start = time.perf_counter()
+    with cprofile_to(options.profile_dir, repo_url):
+        n_commits = _index_repository_(
+            session, options, repo_url, repo_source, is_private_repo, is_remote_repo, author_cache, profile
+        )
+    profile.elapsed += time.perf_counter() - start
+
+    metrics.REPOS_PROCESSED.inc(mode=options.mode)
+    if options.profile:
+        logger.info(f"profile {profile}")
+    return n_commits
+
+
+def _index_repository_(
+    session: Session | None,
+    options: argparse.Namespace,
+    repo_url: str,
+    repo_source: str,
+    is_private_repo: bool,
+    is_remote_repo: bool,
+    author_cache: AuthorCache | None,
+    profile: RepoProfile,
+) -> int:
+    if options.mode in ["metrics", "maintain"]:
+        local_repo_path = (
+            os.path.abspath(clone_url2mirror_path(repo_url, options.mirror_path)) if is_remote_repo else repo_url
+        )
+        if not os.path.isdir(local_repo_path):
+            logger.warning(f"no mirror for {display_url(repo_url)}, skipping")
+            profile.outcome = "skipped"
+            return 0
+
+    if options.mode == "maintain":
+        # local repos are not ours to repack
+        if not is_remote_repo:
+            logger.info(f"{display_url(repo_url)} is not a mirror, skipping")
+            profile.outcome = "skipped"
+            return 0
+        assert session is not None
+        shared = options.shared_objects and share_with_origin(session, repo_url, local_repo_path, options.mirror_path)
+        if not shared and not is_maintenance_due(local_repo_path, options.maintain_interval_days):
+            logger.info(f"maintenance of {display_url(repo_url)} is not due yet, skipping")
+            profile.outcome = "skipped"
+            return 0
+        maintain_mirror(local_repo_path, max_packs=options.max_packs)
+        profile.outcome = "maintained"
+        return 0
+
+    if options.mode == "metrics":
+        assert session is not None
+        profile.outcome = "indexed"
+        return index_code_metrics(
+            session,
+            repo_url,
+            local_repo_path=local_repo_path,
+            repo_source=repo_source,
+            code_metrics=options.code_metrics,
+            batch_size=options.batch_size,
+        )
+
+    if is_remote_repo:
+        # create a local mirror of a remote repo
+        start = time.perf_counter()
+        size_before = repo_size(clone_url2mirror_path(repo_url, options.mirror_path))
+        with profile.stage("mirror"):
+            mirror_path, _ = mirror_repo(
+                repo_url,
+                repo_source=options.source,
+                is_private_repo=is_private_repo,
+                dest_path=options.mirror_path,
+                retries=options.mirror_retries,
+                refs=options.mirror_refs,
+                precheck=not options.always_fetch,
+            )
+        metrics.MIRROR_DURATION.observe(time.perf_counter() - start)
+        if mirror_path is None:
+            logger.warning(f"cannot create mirror for {repo_url}")
+            metrics.ERRORS.inc(stage="mirror", type="MirrorFailed")
+            profile.outcome = "mirror_failed"
+            return 0
+        local_repo_path = mirror_path
+        profile.count("fetch_bytes", max(repo_size(local_repo_path) - size_before, 0))
+        profile.outcome = "mirrored"
+    else:
+        local_repo_path = repo_url
+
+    if options.mode == "commits":
+        assert session is not None
+        _, n_new_commits = index_commits(
+            session,
+            repo_url,
+            repo_source=repo_source,
+            local_repo_path=local_repo_path,
+            index_all=options.all,
+            batch_size=options.batch_size,
+            author_cache=author_cache,
+            engine=options.engine,
+            code_metrics=options.code_metrics,
+            pipeline=options.pipeline,
+            max_memory_mb=options.max_memory_mb,
+            profile=profile,
+        )
+        return n_new_commits
+
+    return 0
+
+
+# each worker process in the pool has its own engine and author cache, created by _init_worker_
+__worker_engine__: Engine | None = None
+__worker_author_cache__: AuthorCache | None = None
+
+
+def _init_worker_(warm_author_cache: bool) -> None:
+    global __worker_engine__, __worker_author_cache__
+    __worker_engine__ = create_sql_engine()
+    __worker_author_cache__ = AuthorCache()
+    if warm_author_cache:
+        with sessionmaker(bind=__worker_engine__)() as session:
+            __worker_author_cache__.warm(session)
+
+
+def _index_repository_worker_(
+    options: argparse.Namespace,
+    repo_url: str,
+    repo_source: str,
+    is_private_repo: bool,
+    is_remote_repo: bool,
+    profile: RepoProfile,
+    take_metrics: bool,
+) -> tuple[str, int, str | None, RepoProfile, dict]:
+    """
+    runs index_repository in a worker process, or thread in mirror mode, returns a tuple of
+    repo_url, n_new_commits, error message, None if no error, profile
+    with the time spent in the worker added and metric values to be
+    merged into the registry of the parent. take_metrics is False for threads, which
+    update the registry of the parent directly
+    """
+
+    def taken_metrics() -> dict:
+        return metrics.REGISTRY.take_values() if take_metrics else {}
+
+    with logger.contextualize(repo=display_url(repo_url)):
+        try:
+            if options.mode == "mirror":
+                # mirroring uses no database, threads have no engine anyway
+                n_new_commits = index_repository(
+                    None, options, repo_url, repo_source, is_private_repo, is_remote_repo, None, profile
+                )
+            else:
+                with sessionmaker(bind=__worker_engine__)() as session:
+                    n_new_commits = index_repository(
+                        session,
+                        options,
+                        repo_url,
+                        repo_source,
+                        is_private_repo,
+                        is_remote_repo,
+                        __worker_author_cache__,
+                        profile,
+                    )
+            return repo_url, n_new_commits, None, profile, taken_metrics()
+        except Exception as e:
+            exc = traceback.format_exc()
+            logger.warning(f"Exception processing repository {display_url(repo_url)} => {str(e)}\n{exc}")
+            metrics.ERRORS.inc(stage="repository", type=type(e).__name__)
+            profile.failed(e)
+            return repo_url, 0, f"{type(e).__name__}: {str(e)}", profile, taken_metrics()
+
+
+def _handle_repos_in_pool_(options: argparse.Namespace, enumerator: Callable, session: Session, run_id: int) -> None:
+    logger.info(f"processing repositories with {options.workers} workers")
+
+    results: list[tuple[str, int, str | None, RepoProfile, dict]] = []
+
+    def collect(future: Future) -> None:
+        results.append(future.result())
+        if results[-1][-1]:
+            metrics.REGISTRY.merge(results[-1][-1])
+        record_repo_run(session, run_id, results[-1][3])
+        update_manifest(session, options.mirror_path, options.mode, results[-1][3])
+        metrics.BACKLOG.set(pool.n_pending())
+
+    executor: Executor
+    if options.mode == "mirror":
+        # mirroring waits on the network and uses no database, threads in this process are enough.
+        # they update the registry of this process, served by --metrics_port, as they go
+        executor = ThreadPoolExecutor(max_workers=options.workers)
+    else:
+        executor = ProcessPoolExecutor(
+            max_workers=options.workers, initializer=_init_worker_, initargs=(options.mode == "commits",)
+        )
+    with executor:
+        pool = HostLimitedExecutor(executor, max_per_host=options.max_per_host)
+        for repo, enumerate_seconds in timed(_repos_to_index_(options, enumerator)):
+            repo_url, _, repo_source, is_private_repo, is_remote_repo = repo
+            profile = RepoProfile(repo_url)
+            profile.add("enumerate", enumerate_seconds)
+            pool.submit(
+                repo_host(repo_url) if is_remote_repo else "",
+                _index_repository_worker_,
+                options,
+                repo_url,
+                repo_source,
+                is_private_repo,
+                is_remote_repo,
+                profile,
+                isinstance(executor, ProcessPoolExecutor),
+            )
+            metrics.BACKLOG.set(pool.n_pending())
+            # collect what is done while enumerating, held back repos are submitted as their host frees up
+            for future in pool.completed(timeout=0):
+                collect(future)
+        for future in pool.completed():
+            collect(future)
+
+    failures = [(repo_url, error) for repo_url, _, error, _, _ in results if error]
+    n_new_commits = sum(n for _, n, _, _, _ in results)
+    logger.info(f"processed {len(results):,} repositories, {n_new_commits:,} new commits, {len(failures):,} failed")
+    for repo_url, error in failures:
+        logger.warning(f"failed {display_url(repo_url)} => {error}")
+
+    if options.profile:
+        log_profile_summary([profile for _, _, _, profile, _ in results])
+
+
+def _export_metrics_(options: argparse.Namespace, engine: Engine, start_t: float) -> None:
+    elapsed = time.time() - start_t
+    metrics.RUN_DURATION.set(elapsed)
+    metrics.COMMITS_PER_SECOND.set(metrics.COMMITS_INDEXED.total() / max(elapsed, 0.001))
+    metrics.BACKLOG.set(0)
+    metrics.LAST_RUN.set(time.time())
+    try:
+        with sessionmaker(bind=engine)() as session:
+            metrics.INCOMPLETE_REPOS.set(session.scalar(select(func.count()).select_from(IndexCheckpoint)))
+    except SQLAlchemyError as e:
+        logger.warning(f"unable to count incomplete repositories => {str(e)}")
+
+    if options.metrics_file:
+        metrics.write_textfile(options.metrics_file)
+        logger.info(f"metrics written to {options.metrics_file}")
 
 
 def create_sql_engine(run_check: bool = False) -> Engine:
@@ -0,0 +1,149 @@
+import traceback
+from collections import defaultdict
+from functools import lru_cache
+
+from git.exc import GitCommandError
+from loguru import logger
+from psycopg import DatabaseError
+from pydriller import Git
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from . import metrics
+from .models import (
+    Commit,
+    CommittedFile,
+    Repository,
+    file_type_of,
+    repo_to_commit_table,
+)
+from .utils import display_url
+from .writer import DEFAULT_BATCH_SIZE
+
+#
+# code metrics are n_lines_of_code, n_methods and n_methods_changed of a committed file.
+# computing them makes pydriller run lizard on both versions of every modified file, which
+# is where most of the cpu time goes when indexing. the policy decides when they are computed
+#
+#   all        compute for all files when indexing commits, the default
+#   off        do not compute
+#   deferred   do not compute when indexing, leave it to a later run of --mode metrics
+#   java,py    compute only for files of the listed file types, see models.file_type_of()
+#
+# commits indexed without code metrics have has_code_metrics set to False
+#
+CODE_METRICS_POLICIES = ["all", "off", "deferred"]
+
+
+def wants_code_metrics(policy: str, file_type: str) -> bool:
+    if policy == "all":
+        return True
+    elif policy in ["off", "deferred"]:
+        return False
+    else:
+        return file_type in _file_types_(policy)
+
+
+def is_valid_policy(policy: str) -> bool:
+    return policy in CODE_METRICS_POLICIES or len(_file_types_(policy)) > 0
+
+
+@lru_cache(maxsize=16)
+def _file_types_(policy: str) -> frozenset[str]:
+    return frozenset(file_type.strip().lower() for file_type in policy.split(",") if file_type.strip())
+
+
+def index_code_metrics(
+    session: Session,
+    clone_url: str,
+    local_repo_path: str,
+    repo_source: str,
+    code_metrics: str = "all",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    """
+    fill in code metrics of commits in the repository that were indexed without them.
+    policy off or deferred computes metrics for all files here.
+
+    returns the number of commits updated
+    """
+    n_commits = 0
+    log_url = display_url(clone_url)
+    if code_metrics in ["off", "deferred"]:
+        code_metrics = "all"
+
+    try:
+        repo = session.query(Repository).filter_by(clone_url=clone_url, repo_type=repo_source).first()
+        if repo is None or repo.is_active is False:
+            logger.info(f"skipping repository {log_url}, not indexed or inactive")
+            return 0
+
+        query = (
+            select(Commit.sha)
+            .join(repo_to_commit_table, repo_to_commit_table.c.commit_id == Commit.sha)
+            .where(repo_to_commit_table.c.repo_id == repo.id, Commit.has_code_metrics.is_(False))
+        )
+        shas = list(session.scalars(query))
+        if not shas:
+            return 0
+
+        logger.info(f"computing code metrics for {len(shas):,} commits in {log_url}")
+        git_repo = Git(local_repo_path)
+        try:
+            for i in range(0, len(shas), batch_size):
+                chunk = shas[i : i + batch_size]
+                _update_code_metrics_(session, git_repo, chunk, code_metrics)
+                n_commits += len(chunk)
+        finally:
+            git_repo.clear()
+
+        logger.info(f"computed code metrics for {n_commits:5,} commits in the repository")
+        return n_commits
+
+    except GitCommandError as e:
+        logger.warning(f"{e._cmdline} returned {e.stderr} for {log_url}")
+        metrics.ERRORS.inc(stage="metrics", type=type(e).__name__)
+        session.rollback()
+    except DatabaseError as e:
+        exc = traceback.format_exc()
+        logger.warning(f"DatabaseError computing code metrics for {log_url} => {str(e)}\n{exc}")
+        metrics.ERRORS.inc(stage="metrics", type=type(e).__name__)
+        session.rollback()
+    except Exception as e:  # pragma: no cover
+        exc = traceback.format_exc()
+        logger.warning(f"Exception computing code metrics for {log_url} => {str(e)}\n{exc}")
+        metrics.ERRORS.inc(stage="metrics", type=type(e).__name__)
+        session.rollback()
+
+    return n_commits
+
+
+def _update_code_metrics_(session: Session, git_repo: Git, shas: list[str], code_metrics: str) -> None:
+    # a commit can have 2 files with the same path and change type, e.g. a type change is
+    # a delete and an add. they are matched to the modified files in order
+    file_ids = defaultdict(list)
+    query = select(CommittedFile.id, CommittedFile.commit_sha, CommittedFile.file_path, CommittedFile.change_type)
+    for file_id, sha, file_path, change_type in session.execute(query.where(CommittedFile.commit_sha.in_(shas))):
+        file_ids[(sha, file_path, change_type)].append(file_id)
+    for ids in file_ids.values():
+        ids.sort()
+
+    updates = []
+    for sha in shas:
+        for mod in git_repo.get_commit(sha).modified_files:
+            file_path = mod.new_path or mod.old_path
+            matching_ids = file_ids.get((sha, file_path, str(mod.change_type).split(".")[1]))
+            if matching_ids and wants_code_metrics(code_metrics, file_type_of(file_path)):
+                updates.append(
+                    {
+                        "id": matching_ids.pop(0),
+                        "n_lines_of_code": mod.nloc if mod.nloc else 0,
+                        "n_methods": len(mod.methods),
+                        "n_methods_changed": len(mod.changed_methods),
+                    }
+                )
+
+    if updates:
+        session.execute(update(CommittedFile), updates)
+    session.execute(update(Commit).where(Commit.sha.in_(shas)).values(has_code_metrics=True))
+    session.commit()
@@ -1,25 +1,65 @@
+import gc
+import sys
+import threading
 import traceback
-from datetime import datetime, timezone
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterator, TypeAlias, Union
 
 from git.exc import GitCommandError
 from loguru import logger
 from psycopg import DatabaseError
-from pydriller import Repository as PyDrillerRepository
+from pydriller import Git
 from pydriller.domain.commit import Commit as PyDrillerCommit
+from sqlalchemy import delete, insert, select
 from sqlalchemy.orm import Session
 
+from . import gitlog, metrics
+from .authors import AuthorCache
+from .code_metrics import wants_code_metrics
 from .models import (
     Author,
     Commit,
     CommittedFile,
+    IndexCheckpoint,
     Repository,
+    RepositoryRef,
     ensure_repository,
+    file_type_of,
     repo_commit_hashes,
+    repo_ref_tips,
+    sha_digest,
 )
-from .utils import display_url, should_exclude_from_stats
+from .pipeline import DEFAULT_QUEUE_SIZE, run_pipeline
+from .profiling import RepoProfile
+from .utils import display_url, rss_mb, should_exclude_from_stats
+from .writer import DEFAULT_BATCH_SIZE, BatchWriter
 
 GITLAB_TIMETSAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
 
+ENGINES = ["pydriller", "gitlog"]
+
+# max commits looked up with one query, sqlite allows 999 bind parameters before 3.32
+_LOOKUP_SIZE_ = 500
+
+GitCommit: TypeAlias = Union[PyDrillerCommit, gitlog.GitLogCommit]
+
+
+@dataclass
+class ExtractedCommit:
+    """a commit in a chunk, with its rows extracted from git if it does not exist in database yet"""
+
+    position: int
+    sha: str
+    created_at: datetime
+    # None when the commit was already indexed as part of another repository
+    commit_row: dict[str, Any] | None = None
+    file_rows: list[dict[str, Any]] = field(default_factory=list)
+    author_email: str = ""
+    author_name: str = ""
+
+
 #
 # notes about timezone handling (TODO: proof read)
 #
@@ -38,9 +78,30 @@ def index_commits(
     repo_source: str,
     index_all: bool = False,
     timeout: int = 28800,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    author_cache: AuthorCache | None = None,
+    engine: str = "pydriller",
+    code_metrics: str = "all",
+    pipeline: bool = False,
+    max_memory_mb: int = 0,
+    profile: RepoProfile | None = None,
 ) -> tuple[Repository | None, int]:
     """
-    this method traverses the local clone and index commits
+    this method traverses the local clone and index commits.
+    new commits are written to database in batches of batch_size.
+    pass the same author_cache when indexing multiple repositories.
+    engine is one of ENGINES, gitlog is faster but does not compute code metrics.
+    code_metrics is a policy from code_metrics.CODE_METRICS_POLICIES or a list of file types.
+    only commits not reachable from the ref tips stored by the last run are traversed,
+    index_all traverses all commits. progress is saved with every batch, a run that
+    times out or fails is resumed from there by the next one.
+    with pipeline, commits are extracted from git in a separate thread while the
+    previous batches are written to database.
+    memory used does not grow with the number of commits, objects other than the
+    repository are removed from the session after every batch. when max_memory_mb
+    is set and the process grows beyond it anyway, the run stops after the current
+    batch like on timeout.
+    time spent in each stage is added to profile when given
 
     returns a tuple of
       repo: the Repository object in db
@@ -49,129 +110,412 @@ def index_commits(
     """
     n_new_commits = 0
     log_url = display_url(clone_url)
+    if profile is None:
+        profile = RepoProfile(clone_url)
 
     try:
         repo = ensure_repository(session, clone_url, repo_source)
         if repo is None:
             logger.warning(f"cannot create repostitory object for {log_url}")
+            profile.outcome = "failed"
             return None, 0
 
         if repo.is_active is False:
             logger.info(f"skipping inactive repository {log_url}")
+            profile.outcome = "skipped"
+            return repo, 0
+
+        # kept outside of the repo object, which is expired when a batch is rolled back
+        repo_id, last_commit_at = repo.id, repo.last_commit_at
+        new_tips = gitlog.ref_tips(local_repo_path)
+        stored_tips = repo_ref_tips(repo)
+        checkpoint = None if index_all else session.get(IndexCheckpoint, repo_id)
+
+        # e.g. a mirror fetch that brought nothing new. the tips are compared instead of
+        # trusting the fetch, a previous run may have failed after the refs were updated
+        if not index_all and checkpoint is None and stored_tips and new_tips == stored_tips:
+            logger.info(f"no ref changed since last indexed, skipping {log_url}")
+            repo.last_indexed_at = datetime.utcnow()  # type: ignore
+            session.commit()
+            profile.outcome = "skipped"
             return repo, 0
 
         logger.info(f"starting to index {log_url}")
         start_t = datetime.now()
 
         old_commits = repo_commit_hashes(repo)
-
-        if repo.last_commit_at and not index_all:
-            index_since = repo.last_commit_at
-        else:
-            index_since = datetime.min  # type: ignore
-
-        for git_commit in PyDrillerRepository(
-            local_repo_path,
-            include_refs=True,
-            include_remotes=True,
-            since=index_since,
-        ).traverse_commits():
-            # impose some timeout to avoid spending tons of time on very large repositories
-            if (datetime.now() - start_t).seconds > timeout:  # pragma: no cover
-                logger.warning(f"### indexing not done after {timeout} seconds, aborting {log_url}")
-                break
-
-            if git_commit.hash not in old_commits:
-                # check if the same repo is already linked to another repo
-                commit = session.query(Commit).filter_by(sha=git_commit.hash).first()
-                if commit is None:
-                    commit = _new_commit_(session, git_commit)
-
-                commit.repos.append(repo)
-                session.add(commit)
-                session.commit()
-
-                if repo.last_commit_at is None or commit.created_at > repo.last_commit_at:  # type: ignore
-                    repo.last_commit_at = commit.created_at
-
-                n_new_commits += 1
-
+        _log_commit_hashes_(old_commits, start_t)
+        if author_cache is None:
+            author_cache = AuthorCache()
+        if engine == "gitlog" and code_metrics != "off":
+            # the gitlog engine does not compute code metrics, leave them to a later run of --mode metrics.
+            # the cli warns about it once per run, not per repository
+            code_metrics = "deferred"
+
+        # walk only commits reachable from the current ref tips but not from the tips
+        # indexed last time. unlike a date based since, this finds old commits merged late
+        old_tips = [] if index_all else gitlog.existing_commits(local_repo_path, sorted(set(stored_tips.values())))
+        shas, n_done = None, 0
+
+        # a previous run that did not complete left a checkpoint, continue with the
+        # same ref tips from the commit after the last one it indexed
+        if checkpoint is not None:
+            resumed = _resume_from_checkpoint_(local_repo_path, checkpoint, old_tips)
+            if resumed is not None:
+                new_tips, shas = resumed
+                n_done = checkpoint.n_done
+                logger.info(f"resuming from checkpoint after {n_done:,} commits, {len(shas):,} commits to go")
+
+        def save_checkpoint(progress: tuple[int, str]) -> None:
+            position, sha = progress
+            session.merge(
+                IndexCheckpoint(
+                    repo_id=repo_id,
+                    ref_tips=new_tips,
+                    n_done=position + 1,
+                    last_sha=sha,
+                    updated_at=datetime.utcnow(),
+                )
+            )
+
+        writer = BatchWriter(
+            session,
+            batch_size=batch_size,
+            on_flush=save_checkpoint,
+            expunge_types=(Author, Commit, CommittedFile, IndexCheckpoint),
+        )
+        deadline = start_t + timedelta(seconds=timeout)
+        # set to stop extracting commits, on timeout or when out of memory
+        stopped = threading.Event()
+
+        def write_chunk(extracted: list[ExtractedCommit]) -> None:
+            nonlocal last_commit_at, n_new_commits
+            with profile.stage("write"):
+                last_commit_at = _write_chunk_(
+                    session, writer, repo_id, extracted, author_cache, last_commit_at, profile
+                )
+            n_new_commits += len(extracted)
+            profile.count("files", sum(len(commit.file_rows) for commit in extracted))
+            if max_memory_mb and not stopped.is_set() and _is_over_memory_limit_(max_memory_mb):
+                logger.warning(f"### memory used is over {max_memory_mb:,} MB, aborting {log_url}")
+                stopped.set()
+
+        with (
+            _traverse_commits_(local_repo_path, engine, _revs_(new_tips, old_tips), shas) as git_commits,
+            _extract_session_(session, pipeline) as extract_session,
+        ):
+            # time spent in git_commits counts towards traverse, the rest of a chunk towards extract
+            git_commits = profile.iterate("traverse", git_commits)
+            chunks = _extract_chunks_(
+                extract_session, git_commits, old_commits, n_done, batch_size, code_metrics, deadline, stopped
+            )
+            chunks = profile.iterate("extract", chunks)
+            if pipeline:
+                stats = run_pipeline(chunks, write_chunk, queue_size=DEFAULT_QUEUE_SIZE)
+                logger.info(f"pipeline: {stats}")
+            else:
+                for extracted in chunks:
+                    write_chunk(extracted)
+
+        if stopped.is_set() and datetime.now() > deadline:  # pragma: no cover
+            logger.warning(f"### indexing not done after {timeout} seconds, aborting {log_url}")
+        is_complete = not stopped.is_set()
+
+        with profile.stage("write"):
+            writer.flush()
+
+        elapsed = (datetime.now() - start_t).total_seconds()
+        metrics.INDEX_DURATION.observe(elapsed)
+        metrics.COMMITS_INDEXED.inc(n_new_commits)
+        profile.count("commits", n_new_commits)
+        profile.count("rows", writer.n_rows_written)
         if n_new_commits > 0:
-            logger.info(f"indexed {n_new_commits:5,} new commits in the repository")
-
+            logger.info(
+                f"indexed {n_new_commits:5,} new commits in the repository, "
+                f"{n_new_commits / max(elapsed, 0.001):,.1f} commits/sec, {writer.n_rows_written:,} rows written"
+            )
+
+        if is_complete:
+            # the tips are only stored when all commits reachable from them are indexed
+            _save_ref_tips_(session, repo_id, new_tips)
+            session.execute(delete(IndexCheckpoint).where(IndexCheckpoint.repo_id == repo_id))
+        repo.last_commit_at = last_commit_at
         repo.last_indexed_at = datetime.utcnow()  # type: ignore
         session.add(repo)
         session.commit()
 
+        profile.outcome = "indexed" if is_complete else "incomplete"
         return repo, n_new_commits
 
     except GitCommandError as e:
         logger.warning(f"{e._cmdline} returned {e.stderr} for {log_url}")
+        metrics.ERRORS.inc(stage="index", type=type(e).__name__)
+        session.rollback()
+        profile.failed(e)
     except DatabaseError as e:
         exc = traceback.format_exc()
         logger.warning(f"DatabaseError indexing repository {log_url} => {str(e)}\n{exc}")
+        metrics.ERRORS.inc(stage="index", type=type(e).__name__)
+        session.rollback()
+        profile.failed(e)
     except Exception as e:  # pragma: no cover
         exc = traceback.format_exc()
         logger.warning(f"Exception indexing repository {log_url} => {str(e)}\n{exc}")
+        metrics.ERRORS.inc(stage="index", type=type(e).__name__)
+        session.rollback()
+        profile.failed(e)
 
     return None, 0
 
 
-def _new_commit_(session: Session, git_commit: PyDrillerCommit) -> Commit:
-    author_email = git_commit.committer.email.lower()
-    author = session.query(Author).filter_by(email=author_email).first()
-    if author is None:
-        author = Author(name=git_commit.committer.name, email=author_email)
-        session.add(author)
-        session.commit()
+def _revs_(new_tips: dict[str, str], old_tips: list[str]) -> list[str]:
+    return sorted(set(new_tips.values())) + [f"^{sha}" for sha in old_tips]
+
+
+def _resume_from_checkpoint_(
+    local_repo_path: str, checkpoint: IndexCheckpoint, old_tips: list[str]
+) -> tuple[dict[str, str], list[str]] | None:
+    """
+    returns the ref tips of the checkpoint and the commits after the last one indexed,
+    None if the checkpoint cannot be used, e.g. its tips are lost to a force push and gc
+    """
+    tips = set(checkpoint.ref_tips.values())
+    if len(gitlog.existing_commits(local_repo_path, sorted(tips))) != len(tips):
+        logger.info("ref tips in checkpoint no longer exist, starting over")
+        return None
+
+    shas = gitlog.rev_list(local_repo_path, _revs_(checkpoint.ref_tips, old_tips))
+    if checkpoint.n_done > len(shas) or shas[checkpoint.n_done - 1] != checkpoint.last_sha:
+        logger.info("commits in checkpoint do not match the repository, starting over")
+        return None
+
+    return checkpoint.ref_tips, shas[checkpoint.n_done :]
+
+
+@contextmanager
+def _traverse_commits_(
+    local_repo_path: str, engine: str, revs: list[str], shas: list[str] | None = None
+) -> Iterator[Iterator[GitCommit]]:
+    """
+    revs are commit shas to include and ^shas to exclude, both engines traverse commits
+    in the same order as gitlog.rev_list(). shas, when given, are the commits to traverse
+    instead, e.g. the rest of an interrupted traversal
+    """
+    if shas == [] or (shas is None and all(rev.startswith("^") for rev in revs)):
+        # empty repository or nothing left
+        yield iter([])
+    elif engine == "gitlog":
+        if shas is None:
+            git_commits = gitlog.traverse_commits(local_repo_path, ["--reverse"], revs=revs)
+        else:
+            git_commits = gitlog.traverse_commits(local_repo_path, ["--no-walk=unsorted"], revs=shas)
+        try:
+            yield git_commits
+        finally:
+            git_commits.close()
+    else:
+        # use pydriller.Git instead of pydriller.Repository, the latter releases
+        # the repo once traversal is done and the last chunk can no longer be read
+        git_repo = Git(local_repo_path)
+        if shas is None:
+            shas = gitlog.rev_list(local_repo_path, revs)
+        try:
+            yield (git_repo.get_commit(sha) for sha in shas)
+        finally:
+            git_repo.clear()
+
+
+def _save_ref_tips_(session: Session, repo_id: int, tips: dict[str, str]) -> None:
+    # replaced in the same transaction as the update of the repository
+    session.execute(delete(RepositoryRef).where(RepositoryRef.repo_id == repo_id))
+    if tips:
+        session.execute(
+            insert(RepositoryRef), [{"repo_id": repo_id, "ref_name": name, "sha": sha} for name, sha in tips.items()]
+        )
+
+
+@contextmanager
+def _extract_session_(session: Session, pipeline: bool) -> Iterator[Session]:
+    # the extraction thread of a pipeline uses its own session, sessions are not thread safe
+    if pipeline:
+        with Session(bind=session.get_bind()) as extract_session:
+            yield extract_session
+    else:
+        yield session
 
-    commit = Commit(
-        sha=git_commit.hash,
-        message=git_commit.msg[:2048],  # some commits has super long message, e.g. squash merge
-        author=author,
-        is_merge=git_commit.merge,
-        n_lines=git_commit.lines,
-        n_files=git_commit.files,
-        n_insertions=git_commit.insertions,
-        n_deletions=git_commit.deletions,
-        created_at_tz=git_commit.committer_date,
-        created_at=git_commit.committer_date.astimezone(timezone.utc).replace(tzinfo=None),
-    )
 
+def _extract_chunks_(
+    session: Session,
+    git_commits: Iterator[GitCommit],
+    old_commits: set[bytes],
+    n_done: int,
+    batch_size: int,
+    code_metrics: str,
+    deadline: datetime,
+    stopped: threading.Event,
+) -> Iterator[list[ExtractedCommit]]:
+    """
+    traverse the commits not yet linked to the repo in chunks of batch_size, along with
+    their position in the traversal. stops when stopped is set, and sets it when the
+    deadline passes. only reads from database, runs in the extraction thread of a pipeline
+    """
+    chunk: list[tuple[int, GitCommit]] = []
+
+    for position, git_commit in enumerate(git_commits, start=n_done):
+        # impose some timeout to avoid spending tons of time on very large repositories
+        if datetime.now() > deadline:  # pragma: no cover
+            stopped.set()
+        if stopped.is_set():
+            # the chunk is dropped, it is traversed again when resuming from the checkpoint
+            return
+
+        if sha_digest(git_commit.hash) not in old_commits:
+            chunk.append((position, git_commit))
+            if len(chunk) >= batch_size:
+                yield _extract_chunk_(session, chunk, code_metrics)
+                chunk = []
+
+    if chunk:
+        yield _extract_chunk_(session, chunk, code_metrics)
+
+
+def _extract_chunk_(session: Session, chunk: list[tuple[int, GitCommit]], code_metrics: str) -> list[ExtractedCommit]:
+    """
+    commits already indexed as part of another repo, e.g. a fork, are looked up
+    with a single query, the rest are extracted from git
+    """
+    shas = [git_commit.hash for _, git_commit in chunk]
+    existing: dict[str, datetime] = {}
+    # a chunk can be larger than the bind parameters a database allows in one statement
+    for start in range(0, len(shas), _LOOKUP_SIZE_):
+        query = select(Commit.sha, Commit.created_at).where(Commit.sha.in_(shas[start : start + _LOOKUP_SIZE_]))
+        existing.update(session.execute(query).tuples().all())
+
+    extracted = []
+    for position, git_commit in chunk:
+        created_at = existing.get(git_commit.hash)
+        if created_at is None:
+            commit_row, file_rows = _new_commit_(git_commit, code_metrics)
+            extracted.append(
+                ExtractedCommit(
+                    position=position,
+                    sha=git_commit.hash,
+                    created_at=commit_row["created_at"],
+                    commit_row=commit_row,
+                    file_rows=file_rows,
+                    author_email=git_commit.committer.email.lower(),
+                    author_name=git_commit.committer.name,
+                )
+            )
+        else:
+            extracted.append(ExtractedCommit(position=position, sha=git_commit.hash, created_at=created_at))
+
+    return extracted
+
+
+def _write_chunk_(
+    session: Session,
+    writer: BatchWriter,
+    repo_id: int,
+    extracted: list[ExtractedCommit],
+    author_cache: AuthorCache,
+    last_commit_at: datetime | None,
+    profile: RepoProfile,
+) -> datetime | None:
+    """
+    create the new commits of a chunk and link all of them to the repo. the position
+    of a commit in the traversal is passed to the writer to be saved as checkpoint.
+    returns the updated last_commit_at
+    """
+    for commit in extracted:
+        if commit.commit_row is not None:
+            with profile.stage("authors"):
+                author_id = author_cache.author_id(session, commit.author_email, commit.author_name)
+            commit.commit_row["author_id"] = author_id
+            writer.add_commit(commit.commit_row, commit.file_rows)
+
+        if last_commit_at is None or commit.created_at > last_commit_at:
+            last_commit_at = commit.created_at
+
+        writer.add_link(repo_id, commit.sha, progress=(commit.position, commit.sha))
+
+    return last_commit_at
+
+
+def _is_over_memory_limit_(max_memory_mb: int) -> bool:
+    if rss_mb() <= max_memory_mb:
+        return False
+    # garbage may be waiting for a collection
+    gc.collect()
+    return rss_mb() > max_memory_mb
+
+
+def _log_commit_hashes_(hashes: set[bytes], start_t: datetime) -> None:
+    if hashes:
+        elapsed = (datetime.now() - start_t).total_seconds()
+        # approximation, the set itself plus one 20 bytes bytes object per sha
+        size = sys.getsizeof(hashes) + len(hashes) * sys.getsizeof(bytes(20))
+        logger.info(f"loaded {len(hashes):,} known commits in {elapsed:.2f} seconds, using {size / 2**20:,.1f} MB")
+
+
+def _new_commit_(git_commit: GitCommit, code_metrics: str = "all") -> tuple[dict[str, Any], list[dict[str, Any]]]:
+    """
+    returns the gi_commits row, without author_id, and gi_committed_files rows for a
+    git commit, to be written to database by BatchWriter. code metrics are only read
+    from the git commit for file types wanted by the code_metrics policy, reading
+    them is what makes pydriller run lizard on the files
+    """
+    commit_row = {
+        "sha": git_commit.hash,
+        "message": git_commit.msg[:2048],  # some commits has super long message, e.g. squash merge
+        "is_merge": git_commit.merge,
+        "n_lines": git_commit.lines,
+        "n_files": git_commit.files,
+        "n_insertions": git_commit.insertions,
+        "n_deletions": git_commit.deletions,
+        "created_at_tz": git_commit.committer_date,
+        "created_at": git_commit.committer_date.astimezone(timezone.utc).replace(tzinfo=None),
+        "has_code_metrics": code_metrics not in ["off", "deferred"],
+    }
+
+    file_rows = []
     n_lines_changed, n_lines_ignored, n_files_changed, n_files_ignored = 0, 0, 0, 0
 
     for mod in git_commit.modified_files:
-        file_path = mod.new_path or mod.old_path
+        file_path = mod.new_path or mod.old_path or ""
         is_excluded = should_exclude_from_stats(file_path)
-
-        new_file = CommittedFile(
-            commit_sha=git_commit.hash,
-            change_type=str(mod.change_type).split(".")[1],  # enum ModificationType.ADD => "ADD"
-            file_path=file_path,
-            file_name=mod.filename,
-            n_lines_added=mod.added_lines,
-            n_lines_deleted=mod.deleted_lines,
-            n_lines_changed=mod.added_lines + mod.deleted_lines,
-            n_lines_of_code=mod.nloc if mod.nloc else 0,
-            n_methods=len(mod.methods),
-            n_methods_changed=len(mod.changed_methods),
-            is_on_exclude_list=is_excluded,
-            is_superfluous=is_excluded,
-            commit=commit,
+        file_lines_changed = mod.added_lines + mod.deleted_lines
+        file_type = file_type_of(file_path)
+        with_metrics = wants_code_metrics(code_metrics, file_type)
+
+        file_rows.append(
+            {
+                "commit_sha": git_commit.hash,
+                "change_type": str(mod.change_type).split(".")[1],  # enum ModificationType.ADD => "ADD"
+                "file_path": file_path,
+                "file_name": mod.filename,
+                "file_type": file_type,
+                "n_lines_added": mod.added_lines,
+                "n_lines_deleted": mod.deleted_lines,
+                "n_lines_changed": file_lines_changed,
+                "n_lines_of_code": (mod.nloc if mod.nloc else 0) if with_metrics else 0,
+                "n_methods": len(mod.methods) if with_metrics else 0,
+                "n_methods_changed": len(mod.changed_methods) if with_metrics else 0,
+                "is_on_exclude_list": is_excluded,
+                "is_superfluous": is_excluded,
+            }
         )
-        session.add(new_file)
 
         if is_excluded:
             n_files_ignored += 1
-            n_lines_ignored += new_file.n_lines_changed
+            n_lines_ignored += file_lines_changed
         else:
             n_files_changed += 1
-            n_lines_changed += new_file.n_lines_changed
+            n_lines_changed += file_lines_changed
 
-    commit.n_lines_changed = n_lines_changed
-    commit.n_lines_ignored = n_lines_ignored
-    commit.n_files_changed = n_files_changed
-    commit.n_files_ignored = n_files_ignored
-    session.add(commit)
+    commit_row["n_lines_changed"] = n_lines_changed
+    commit_row["n_lines_ignored"] = n_lines_ignored
+    commit_row["n_files_changed"] = n_files_changed
+    commit_row["n_files_ignored"] = n_files_ignored
 
-    return commit
+    return commit_row, file_rows
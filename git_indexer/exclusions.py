@@ -0,0 +1,95 @@
+import os
+import re
+from functools import lru_cache
+
+from loguru import logger
+
+# files matching any of the regex will not be counted
+# towards commit stats. a regex matches from the start of the path
+DEFAULT_EXCLUDE_PATTERNS = [
+    "^(vendor|Pods|target|YoutuOCWrapper|vos-app-protection|vos-processor|\\.idea|\\.vscode)/.",
+    "^[a-zA-Z0-9_]*?/Pods/",
+    "^.*(xcodeproj|xcworkspace)/.",
+    r".*\.(jar|pbxproj|lock|bk|bak|backup|class|swp|sum|pdf|png)$",
+    r"^.*/?package-lock\.json$",
+    r"^.*/?(\.next|node_modules|\.devcontainer)(/|$).*",
+    r"(^|.*/)_.*\.(js|scss)$",
+]
+
+# a file with one regex per line replaces the default patterns,
+# blank lines and lines starting with # are ignored
+EXCLUDE_PATTERNS_FILE_ENV = "EXCLUDE_PATTERNS_FILE"
+
+# the same paths show up in commit after commit of a repository
+DEFAULT_CACHE_SIZE = 100000
+
+# inline flags at the start of a pattern, e.g. (?i), apply to the whole regex. in the
+# combined regex they are scoped to the group of the pattern instead, e.g. (?i:...)
+_LEADING_FLAGS_ = re.compile(r"^\(\?([aiLmsux]+)\)")
+# group numbers and names refer to other patterns once combined
+_GROUP_REFERENCE_ = re.compile(r"(?<!\\)(?:\\\\)*\\[1-9]|\(\?P=|\(\?\(")
+
+
+def _group_(pattern: str) -> str:
+    flags = _LEADING_FLAGS_.match(pattern)
+    if flags:
+        return f"(?{flags.group(1)}:{pattern[flags.end():]})"
+    return f"(?:{pattern})"
+
+
+def _combine_(patterns: list[str]) -> re.Pattern:
+    # each pattern is its own group, re.match anchors every alternative
+    # at the start of the path like matching the patterns one by one
+    return re.compile("|".join(_group_(pattern) for pattern in patterns))
+
+
+class PathExcluder:
+    """
+    matches paths against a list of regex with a single combined regex,
+    results are memoized per path in a bounded lru cache
+    """
+
+    def __init__(self, patterns: list[str], cache_size: int = DEFAULT_CACHE_SIZE):
+        self.patterns = patterns
+        self._regex = _combine_(patterns) if patterns else None
+        self.is_excluded = lru_cache(maxsize=cache_size)(self._match_)
+
+    def _match_(self, path: str) -> bool:
+        return self._regex is not None and self._regex.match(path) is not None
+
+
+def load_patterns(patterns_file: str) -> list[str]:
+    """
+    patterns from a file, raises re.error naming the file and the pattern
+    when a pattern is invalid or cannot be combined with the others
+    """
+    with open(patterns_file, "r") as f:
+        lines = [line.strip() for line in f.readlines()]
+    patterns = [line for line in lines if line and not line.startswith("#")]
+    for pattern in patterns:
+        # fail early with the offending pattern rather than in the combined regex
+        try:
+            re.compile(_group_(pattern))
+        except re.error as e:
+            raise re.error(f"invalid exclude pattern {pattern!r} in {patterns_file} => {e}") from e
+        if _GROUP_REFERENCE_.search(pattern):
+            raise re.error(f"exclude pattern {pattern!r} in {patterns_file} refers to a group, which is not supported")
+    try:
+        _combine_(patterns)
+    except re.error as e:
+        raise re.error(f"exclude patterns in {patterns_file} cannot be combined => {e}") from e
+    return patterns
+
+
+@lru_cache(maxsize=1)
+def default_excluder() -> PathExcluder:
+    """
+    the excluder used for commit stats, with patterns from the file named by
+    EXCLUDE_PATTERNS_FILE if set. created once per process
+    """
+    patterns_file = os.environ.get(EXCLUDE_PATTERNS_FILE_ENV)
+    if patterns_file:
+        patterns = load_patterns(patterns_file)
+        logger.info(f"loaded {len(patterns)} exclude patterns from {patterns_file}")
+        return PathExcluder(patterns)
+    return PathExcluder(DEFAULT_EXCLUDE_PATTERNS)
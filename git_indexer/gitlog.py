@@ -0,0 +1,294 @@
+import os
+import subprocess
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Generator, Iterator, Optional
+
+from git.exc import GitCommandError
+from pydriller.domain.commit import ModificationType
+
+# each commit starts with a record separator, followed by NUL terminated header fields
+_LOG_FORMAT_ = "%x1e%H%x00%P%x00%cn%x00%ce%x00%cI%x00%B%x00"
+_N_HEADER_FIELDS_ = 6
+
+_READ_SIZE_ = 65536
+
+
+@dataclass
+class GitLogDeveloper:
+    name: str
+    email: str
+
+
+@dataclass
+class GitLogModifiedFile:
+    """
+    same attributes as pydriller.domain.commit.ModifiedFile that are used
+    by the commit indexer. code metrics are not computed by this engine
+    """
+
+    change_type: ModificationType
+    old_path: Optional[str]
+    new_path: Optional[str]
+    added_lines: int = 0
+    deleted_lines: int = 0
+    nloc: Optional[int] = None
+    methods: list = field(default_factory=list)
+    changed_methods: list = field(default_factory=list)
+
+    @property
+    def filename(self) -> str:
+        return Path(self.new_path or self.old_path).name  # type: ignore
+
+
+@dataclass
+class GitLogCommit:
+    """
+    same attributes as pydriller.domain.commit.Commit that are used
+    by the commit indexer
+    """
+
+    hash: str  # noqa: A003, VNE003
+    parents: list[str]
+    committer: GitLogDeveloper
+    committer_date: datetime
+    msg: str
+    insertions: int = 0
+    deletions: int = 0
+    files: int = 0
+    modified_files: list[GitLogModifiedFile] = field(default_factory=list)
+    # modified files for each --raw entry, in the order their --numstat entries will follow
+    _diff_entries_: list[list[GitLogModifiedFile]] = field(default_factory=list, repr=False)
+
+    @property
+    def merge(self) -> bool:
+        return len(self.parents) > 1
+
+    @property
+    def lines(self) -> int:
+        return self.insertions + self.deletions
+
+
+def traverse_commits(
+    repo_path: str, rev_args: list[str], revs: list[str] | None = None
+) -> Generator[GitLogCommit, None, None]:
+    """
+    traverse commits with a single git log process and parse its output as
+    a stream. revs, e.g. tips and ^excluded tips, are passed to git on stdin
+    as there can be too many of them for the command line.
+    produces the same result as the pydriller engine, except:
+
+      * nloc, methods and changed_methods are not available
+      * added and deleted lines are taken from --numstat. pydriller counts lines
+        in the patch and skips added lines starting with "++" or deleted lines
+        starting with "--", so its counts can be lower for such lines
+
+    like pydriller, merge commits have no modified files, and their stats
+    are computed against the first parent
+    """
+    command = [
+        "git",
+        "-c",
+        "log.showSignature=false",
+        "log",
+        f"--format={_LOG_FORMAT_}",
+        "-z",
+        "--raw",
+        "--numstat",
+        "--no-abbrev",
+        "-M",
+        "--diff-merges=first-parent",
+        "--no-color",
+        "--no-ext-diff",
+        "--no-textconv",
+        *rev_args,
+        *(["--stdin"] if revs is not None else []),
+        "--",
+    ]
+    process = subprocess.Popen(
+        command,
+        cwd=repo_path,
+        stdin=subprocess.PIPE if revs is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        if revs is not None:
+            # git reads all of stdin before it starts to write output
+            process.stdin.write("".join(f"{rev}\n" for rev in revs).encode())  # type: ignore
+            process.stdin.close()  # type: ignore
+
+        yield from _parse_log_(_read_tokens_(process.stdout))
+
+        stderr = process.stderr.read()  # type: ignore
+        if process.wait() != 0:
+            raise GitCommandError(command, process.returncode, stderr)
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()  # type: ignore
+        process.stderr.close()  # type: ignore
+
+
+def ref_tips(repo_path: str) -> dict[str, str]:
+    """
+    returns ref name => sha of the commit at its tip, for all refs and HEAD.
+    annotated tags are peeled to their commit, refs to other objects are left out
+    """
+    output = _run_git_(
+        repo_path,
+        ["for-each-ref", "--format=%(refname)%00%(objecttype)%00%(objectname)%00%(*objecttype)%00%(*objectname)"],
+    )
+    tips = {}
+    for line in output.splitlines():
+        ref_name, object_type, sha, peeled_type, peeled_sha = line.split("\0")
+        if object_type == "commit":
+            tips[ref_name] = sha
+        elif peeled_type == "commit":
+            tips[ref_name] = peeled_sha
+
+    # detached HEAD in a working copy, fails in an empty repository
+    head = subprocess.run(
+        ["git", "rev-parse", "--verify", "-q", "HEAD^{commit}"], cwd=repo_path, capture_output=True, text=True
+    )
+    if head.returncode == 0:
+        tips["HEAD"] = head.stdout.strip()
+
+    return tips
+
+
+def existing_commits(repo_path: str, shas: list[str]) -> list[str]:
+    """returns the shas that are commits in the repository, e.g. tips not yet lost to a force push and gc"""
+    if not shas:
+        return []
+    output = _run_git_(repo_path, ["cat-file", "--batch-check=%(objectname) %(objecttype)"], stdin="\n".join(shas))
+    return [line.split(" ")[0] for line in output.splitlines() if line.endswith(" commit")]
+
+
+def rev_list(repo_path: str, revs: list[str]) -> list[str]:
+    """returns the shas of commits reachable from revs in the same order as traverse_commits"""
+    output = _run_git_(repo_path, ["rev-list", "--reverse", "--stdin"], stdin="".join(f"{rev}\n" for rev in revs))
+    return output.split()
+
+
+def repo_size(repo_path: str) -> int:
+    """returns the bytes used by objects in the repository, loose and packed, 0 if it is not a repository"""
+    if not os.path.isdir(repo_path):
+        return 0
+    try:
+        output = _run_git_(repo_path, ["count-objects", "-v"])
+    except GitCommandError:
+        return 0
+    sizes = dict(line.split(": ", 1) for line in output.splitlines() if ": " in line)
+    # in KiB
+    return (int(sizes.get("size", 0)) + int(sizes.get("size-pack", 0))) * 1024
+
+
+def _run_git_(repo_path: str, args: list[str], stdin: str | None = None) -> str:
+    command = ["git", *args]
+    result = subprocess.run(command, cwd=repo_path, input=stdin, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise GitCommandError(command, result.returncode, result.stderr)
+    return result.stdout
+
+
+def _read_tokens_(stream) -> Iterator[str]:
+    """split a stream by NUL without reading all of it into memory"""
+    pending = b""
+    while chunk := stream.read(_READ_SIZE_):
+        tokens = (pending + chunk).split(b"\0")
+        pending = tokens.pop()
+        for token in tokens:
+            yield token.decode("utf-8", errors="replace")
+    if pending:
+        yield pending.decode("utf-8", errors="replace")
+
+
+def _parse_log_(tokens: Iterator[str]) -> Iterator[GitLogCommit]:
+    commit = None
+
+    for token in tokens:
+        # git puts a new line between the header and the diff output
+        token = token.lstrip("\n")
+        if token.startswith("\x1e"):
+            if commit is not None:
+                yield commit
+            commit = _parse_header_(token[1:], tokens)
+        elif commit is None or token == "":
+            continue
+        elif token.startswith(":"):
+            _parse_raw_(commit, token, tokens)
+        else:
+            _parse_numstat_(commit, token, tokens)
+
+    if commit is not None:
+        yield commit
+
+
+def _parse_header_(sha: str, tokens: Iterator[str]) -> GitLogCommit:
+    parents, name, email, date, message = [next(tokens) for _ in range(_N_HEADER_FIELDS_ - 1)]
+    return GitLogCommit(
+        hash=sha,
+        parents=parents.split(),
+        committer=GitLogDeveloper(name=name, email=email),
+        committer_date=datetime.fromisoformat(date),
+        msg=message.strip(),
+    )
+
+
+def _parse_raw_(commit: GitLogCommit, token: str, tokens: Iterator[str]) -> None:
+    # :old_mode new_mode old_sha new_sha status, followed by 1 path, or 2 for renames and copies
+    _, _, old_sha, new_sha, status = token[1:].split(" ")
+    if status[0] in "RC":
+        old_path, new_path = next(tokens), next(tokens)
+    else:
+        old_path = new_path = next(tokens)
+
+    # merge commits have --diff-merges output for stats, but no modified files
+    if commit.merge:
+        return
+
+    if status[0] == "A":
+        mods = [GitLogModifiedFile(ModificationType.ADD, None, new_path)]
+    elif status[0] == "D":
+        mods = [GitLogModifiedFile(ModificationType.DELETE, old_path, None)]
+    elif status[0] == "R":
+        mods = [GitLogModifiedFile(ModificationType.RENAME, old_path, new_path)]
+    elif status[0] == "T":
+        # pydriller sees a type change, e.g. symlink to file, as a delete and an add
+        mods = [
+            GitLogModifiedFile(ModificationType.DELETE, old_path, None),
+            GitLogModifiedFile(ModificationType.ADD, None, new_path),
+        ]
+    elif status[0] == "M" and old_sha != new_sha:
+        mods = [GitLogModifiedFile(ModificationType.MODIFY, old_path, new_path)]
+    else:
+        # e.g. a change of file mode only
+        mods = [GitLogModifiedFile(ModificationType.UNKNOWN, old_path, new_path)]
+
+    commit.modified_files.extend(mods)
+    commit._diff_entries_.append(mods)
+
+
+def _parse_numstat_(commit: GitLogCommit, token: str, tokens: Iterator[str]) -> None:
+    # added, deleted, path. path is empty for renames and copies, followed by old and new path
+    raw_added, raw_deleted, path = token.split("\t", 2)
+    if path == "":
+        _, path = next(tokens), next(tokens)
+
+    # binary files have - as number of lines
+    added = int(raw_added) if raw_added != "-" else 0
+    deleted = int(raw_deleted) if raw_deleted != "-" else 0
+
+    commit.insertions += added
+    commit.deletions += deleted
+    commit.files += 1
+
+    # --raw output comes before --numstat for each commit, in the same order
+    if not commit.merge:
+        for mod in commit._diff_entries_[commit.files - 1]:
+            assert (mod.new_path or mod.old_path) == path, f"unexpected numstat entry {path} in {commit.hash}"
+            mod.added_lines = added if mod.change_type != ModificationType.DELETE else 0
+            mod.deleted_lines = deleted if mod.change_type != ModificationType.ADD else 0
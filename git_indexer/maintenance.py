@@ -0,0 +1,82 @@
+import time
+from dataclasses import dataclass
+
+import git
+from loguru import logger
+
+from .shared_objects import is_shared
+
+#
+# mirrors are only ever updated by git fetch, which adds a pack per fetch and never writes a
+# commit-graph. maintenance of a mirror, at most once per interval, does
+#
+#   commit-graph       git commit-graph write --reachable --changed-paths, commit parents and
+#                      dates without parsing objects, and bloom filters of changed paths
+#   repack             git repack -a -d -l into a single pack, when there are more than max_packs.
+#                      unreachable objects are kept in mirrors lending objects to forks
+#   multi-pack-index   git multi-pack-index write when more than one pack is left
+#
+# the time of the last maintenance is kept in the config of the mirror, as gitindexer.maintainedat
+#
+DEFAULT_INTERVAL_DAYS = 7
+DEFAULT_MAX_PACKS = 20
+_MAINTAINED_AT_KEY_ = "gitindexer.maintainedat"
+
+
+@dataclass
+class MaintenanceReport:
+    repo_path: str
+    packs_before: int
+    packs_after: int
+    # seconds to walk all commits, like a traversal does
+    traverse_before: float
+    traverse_after: float
+    steps: list[str]
+
+    def __str__(self) -> str:
+        return (
+            f"packs {self.packs_before} -> {self.packs_after}, "
+            f"traverse {self.traverse_before:.2f}s -> {self.traverse_after:.2f}s, "
+            f"{' '.join(self.steps) or 'nothing to do'}"
+        )
+
+
+def is_maintenance_due(repo_path: str, interval_days: float = DEFAULT_INTERVAL_DAYS) -> bool:
+    try:
+        maintained_at = float(git.Repo(repo_path).git.config("--get", _MAINTAINED_AT_KEY_))
+    except (git.GitCommandError, ValueError):
+        return True
+    return time.time() - maintained_at >= interval_days * 86400
+
+
+def count_packs(repo_path: str) -> int:
+    output = git.Repo(repo_path).git.count_objects("-v")
+    sizes = dict(line.split(": ", 1) for line in output.splitlines() if ": " in line)
+    return int(sizes.get("packs", 0))
+
+
+def time_traversal(repo_path: str) -> float:
+    start = time.perf_counter()
+    git.Repo(repo_path).git.rev_list("--all", "--count")
+    return time.perf_counter() - start
+
+
+def maintain_mirror(repo_path: str, max_packs: int = DEFAULT_MAX_PACKS) -> MaintenanceReport:
+    repo = git.Repo(repo_path)
+    packs_before, traverse_before = count_packs(repo_path), time_traversal(repo_path)
+
+    steps = []
+    if packs_before > max_packs:
+        repo.git.repack("-a", "-d", "-l", "-q", *(["--keep-unreachable"] if is_shared(repo_path) else []))
+        steps.append("repack")
+    repo.git.commit_graph("write", "--reachable", "--changed-paths")
+    steps.append("commit-graph")
+    packs_after = count_packs(repo_path)
+    if packs_after > 1:
+        repo.git.multi_pack_index("write")
+        steps.append("multi-pack-index")
+    repo.git.config(_MAINTAINED_AT_KEY_, str(int(time.time())))
+
+    report = MaintenanceReport(repo_path, packs_before, packs_after, traverse_before, time_traversal(repo_path), steps)
+    logger.info(f"maintained {repo_path}: {report}")
+    return report
@@ -0,0 +1,205 @@
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from loguru import logger
+
+#
+# counters, gauges and histograms of an indexer run, exported in prometheus text format
+# with --metrics_file at the end of a run, e.g. for the node exporter textfile collector,
+# or from http://host:port/metrics with --metrics_port while the run is going on.
+#
+# each worker process of a pool has its own registry. its values are sent to the parent
+# with the result of each repository and merged into the registry of the parent
+#
+
+# seconds, from a batch write to indexing a very large repository
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key_(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels_(self, key: tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape_(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def total(self) -> float:
+        return sum(self._values.values())
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{self._labels_(key)} {_format_(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key_(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:  # noqa: A003
+        with self._lock:
+            self._values[self._key_(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key_(labels)
+        with self._lock:
+            # count of each bucket, not cumulative, followed by sum and count
+            values = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            values[next(i for i, bound in enumerate(self.buckets) if value <= bound)] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def total(self) -> float:
+        return sum(values[-1] for values in self._values.values())
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, values in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = 'le="' + ("+Inf" if bound == math.inf else _format_(bound)) + '"'
+                lines.append(f"{self.name}_bucket{self._labels_(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels_(key)} {_format_(values[-2])}")
+            lines.append(f"{self.name}_count{self._labels_(key)} {values[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register_(Counter(name, documentation, labelnames))  # type: ignore
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._register_(Gauge(name, documentation, labelnames))  # type: ignore
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Histogram:
+        return self._register_(Histogram(name, documentation, labelnames))  # type: ignore
+
+    def _register_(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "".join(line + "\n" for metric in self.metrics.values() for line in metric.render())
+
+    def take_values(self) -> dict[str, dict]:
+        """
+        returns the values of counters and histograms and resets them, to be
+        merged into the registry of another process. gauges are left alone
+        """
+        values = {}
+        for metric in self.metrics.values():
+            if not isinstance(metric, Gauge):
+                with metric._lock:
+                    values[metric.name], metric._values = metric._values, {}
+        return values
+
+    def merge(self, values: dict[str, dict]) -> None:
+        for name, metric_values in values.items():
+            metric = self.metrics[name]
+            with metric._lock:
+                for key, value in metric_values.items():
+                    if isinstance(metric, Histogram):
+                        old = metric._values.setdefault(key, [0] * len(value))
+                        metric._values[key] = [a + b for a, b in zip(old, value)]
+                    else:
+                        metric._values[key] = metric._values.get(key, 0) + value
+
+
+def _escape_(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+REGISTRY = Registry()
+
+REPOS_PROCESSED = REGISTRY.counter("git_indexer_repos_processed_total", "repositories processed", ("mode",))
+COMMITS_INDEXED = REGISTRY.counter("git_indexer_commits_indexed_total", "new commits indexed")
+ERRORS = REGISTRY.counter("git_indexer_errors_total", "errors processing repositories", ("stage", "type"))
+MIRROR_DURATION = REGISTRY.histogram("git_indexer_mirror_duration_seconds", "time to clone or fetch a mirror")
+INDEX_DURATION = REGISTRY.histogram(
+    "git_indexer_index_duration_seconds", "time to index the new commits of a repository"
+)
+WRITE_DURATION = REGISTRY.histogram("git_indexer_batch_write_seconds", "time to write a batch of commits to database")
+# repositories are enumerated one at a time as they are processed with --workers 1, there is no backlog then
+BACKLOG = REGISTRY.gauge(
+    "git_indexer_backlog_repos", "repositories enumerated but not processed yet by the worker pool, 0 without one"
+)
+INCOMPLETE_REPOS = REGISTRY.gauge(
+    "git_indexer_incomplete_repos", "repositories with indexing not done, to be resumed by the next run"
+)
+COMMITS_PER_SECOND = REGISTRY.gauge("git_indexer_commits_per_second", "new commits indexed per second during the run")
+RUN_DURATION = REGISTRY.gauge("git_indexer_run_duration_seconds", "duration of the last run")
+LAST_RUN = REGISTRY.gauge("git_indexer_last_run_timestamp_seconds", "unix time the last run finished")
+
+
+def write_textfile(path: str, registry: Registry = REGISTRY) -> None:
+    # written to a temp file first, a collector never reads a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler_(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):  # noqa: N802
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def serve_metrics(port: int, host: str = "") -> ThreadingHTTPServer:
+    """serve /metrics from a daemon thread until the process exits or the server is shut down"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler_)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"serving metrics on port {server.server_address[1]}")
+    return server
@@ -1,20 +1,37 @@
+import hashlib
 import os
+import random
 import re
 import shlex
+import shutil
 import subprocess
+import time
 
 import git
 from loguru import logger
 
 from .utils import clone_url2mirror_path, display_url
 
+DEFAULT_BACKOFF_SECONDS = 5.0
+# digest of the refs advertised by the origin at the last fetch, see advertised_refs
+_REMOTE_REFS_KEY_ = "gitindexer.remoterefs"
 
-def run(command: str) -> bool:
+# fetch refspecs of a mirror for each --mirror_refs policy. all is what git clone --mirror sets up,
+# including refs/pull/* on github and refs/merge-requests/* on gitlab. branches skips those
+MIRROR_REFSPECS = {
+    "all": ["+refs/*:refs/*"],
+    "branches": ["+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"],
+}
+
+
+def run(command: str, cwd: str) -> bool:
+    # commands run in an explicit directory, the process wide working directory
+    # is never changed so that many mirrors can be updated from threads at the same time
     # redact the credential part of the url before logging
     log_cmd = re.sub(r"(?<=:\/\/).+?@", "***:***@", command)
-    logger.info(f"running '{log_cmd}' in {os.getcwd()}")
+    logger.info(f"running '{log_cmd}' in {cwd}")
 
-    process = subprocess.run(shlex.split(command), capture_output=True, text=True)
+    process = subprocess.run(shlex.split(command), cwd=cwd, capture_output=True, text=True)
 
     if process.returncode == 0:
         logger.debug(f"{process.stdout}")
@@ -25,58 +42,159 @@ def run(command: str) -> bool:
 
 
 def mirror_repo(
-    clone_url: str, repo_source: str, is_private_repo: bool, dest_path: str, overwrite: bool = False
+    clone_url: str,
+    repo_source: str,
+    is_private_repo: bool,
+    dest_path: str,
+    overwrite: bool = False,
+    retries: int = 0,
+    backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+    refs: str = "all",
+    precheck: bool = True,
 ) -> tuple[str | None, bool]:
     """
-    create a local mirror (as a bare repo) of a remote repo
+    create a local mirror (as a bare repo) of a remote repo, with the refs of
+    a policy in MIRROR_REFSPECS. the policy is applied to existing mirrors too
+    with precheck, an existing mirror is not fetched when the refs advertised by
+    git ls-remote are the same as those after its last fetch
+    a failed clone or fetch is retried up to retries times, waiting backoff_seconds
+    doubled on each attempt with some jitter, e.g. when the server throttles us
     returns a tuple:
       mirror_path: path of mirror repo if a mirror is created or updated, None if failed
       is_new: True if a new mirror is created, False if an existing mirror is updated
 
     """
+    result = _mirror_repo_(clone_url, repo_source, is_private_repo, dest_path, overwrite, refs, precheck)
+    for attempt in range(1, retries + 1):
+        if result[0] is not None:
+            break
+        delay = backoff_seconds * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+        logger.info(f"retrying {display_url(clone_url)} in {delay:.1f}s, attempt {attempt} of {retries}")
+        time.sleep(delay)
+        # a failed clone can leave an empty directory behind
+        result = _mirror_repo_(
+            clone_url, repo_source, is_private_repo, dest_path, overwrite=True, refs=refs, precheck=precheck
+        )
+    return result
+
+
+def _mirror_repo_(
+    clone_url: str,
+    repo_source: str,
+    is_private_repo: bool,
+    dest_path: str,
+    overwrite: bool,
+    refs: str,
+    precheck: bool,
+) -> tuple[str | None, bool]:
     repo_dir = os.path.abspath(clone_url2mirror_path(clone_url, dest_path))
     log_url = display_url(clone_url)
 
-    cwd = os.getcwd()
-    try:
-        if os.path.isdir(repo_dir) and os.path.isfile(f"{repo_dir}/HEAD"):
-            if is_private_repo and update_remote_url(repo_dir, repo_source):
-                logger.info(f"Updated remote url for {log_url}")
-
-            # mirror directory exists and seems like a legit bare git repo
-            os.chdir(repo_dir)
-
-            if run("git fetch --prune"):
-                logger.info(f"Updated existing repo {repo_dir} from {log_url}")
-                return repo_dir, False
-            else:
-                logger.warning(f"unable to fetch {log_url}")
-                return None, False
-
-        elif os.path.isdir(repo_dir) and overwrite:
-            # mirror directory exists but not a git repo. we overwrite it
-            logger.info(f"{repo_dir} exists but is not a bare git repo, removing all contents")
-            run(f"rm -rf {repo_dir}")
-        else:
-            # repo_dir does not exist, create it.
-            # git clone --mirror won't complain if the target already exists but is empty
-            os.makedirs(repo_dir, exist_ok=False)
+    if os.path.isdir(repo_dir) and os.path.isfile(f"{repo_dir}/HEAD"):
+        if is_private_repo and update_remote_url(repo_dir, repo_source):
+            logger.info(f"Updated remote url for {log_url}")
 
-        os.chdir(repo_dir + "/..")
+        # mirror directory exists and seems like a legit bare git repo
+        if set_refspecs(repo_dir, refs):
+            logger.info(f"Changed refs mirrored for {log_url} to {refs}")
 
-        if is_private_repo:
-            full_url = url_with_token(clone_url, repo_source)
-        else:
-            full_url = clone_url
-        if run(f"git clone --mirror {full_url}") and os.path.isfile(f"{repo_dir}/HEAD"):
-            logger.info(f"Created new mirror in {repo_dir} for {log_url}")
-            return repo_dir, True
+        advertised = advertised_refs(repo_dir, refs) if precheck else None
+        if advertised is not None and advertised == _get_config_(repo_dir, _REMOTE_REFS_KEY_):
+            logger.info(f"refs of {log_url} unchanged since last fetch, skipping fetch")
+            return repo_dir, False
+
+        if run("git fetch --prune", cwd=repo_dir):
+            if advertised is not None:
+                git.Repo(repo_dir).git.config(_REMOTE_REFS_KEY_, advertised)
+            logger.info(f"Updated existing repo {repo_dir} from {log_url}")
+            return repo_dir, False
         else:
-            logger.warning(f"unable to clone {log_url}")
+            logger.warning(f"unable to fetch {log_url}")
             return None, False
 
-    finally:
-        os.chdir(cwd)
+    elif os.path.isdir(repo_dir) and overwrite:
+        # mirror directory exists but not a git repo. we overwrite it
+        logger.info(f"{repo_dir} exists but is not a bare git repo, removing all contents")
+        shutil.rmtree(repo_dir)
+        os.makedirs(repo_dir)
+    else:
+        # repo_dir does not exist, create it.
+        # git clone --mirror won't complain if the target already exists but is empty
+        os.makedirs(repo_dir, exist_ok=False)
+
+    if is_private_repo:
+        full_url = url_with_token(clone_url, repo_source)
+    else:
+        full_url = clone_url
+    # a bare clone gets only branches and tags, the refspecs of the policy are set up after it
+    clone_cmd = f"git clone {'--mirror' if refs == 'all' else '--bare'} {full_url} {shlex.quote(repo_dir)}"
+    if run(clone_cmd, cwd=os.path.dirname(repo_dir)) and os.path.isfile(f"{repo_dir}/HEAD"):
+        if refs != "all":
+            set_refspecs(repo_dir, refs)
+        if precheck:
+            # so that the first update of the mirror can skip the fetch too
+            advertised = advertised_refs(repo_dir, refs)
+            if advertised is not None:
+                git.Repo(repo_dir).git.config(_REMOTE_REFS_KEY_, advertised)
+        logger.info(f"Created new mirror in {repo_dir} for {log_url}")
+        return repo_dir, True
+    else:
+        logger.warning(f"unable to clone {log_url}")
+        return None, False
+
+
+def advertised_refs(repo_path: str, refs: str) -> str | None:
+    """
+    digest of the refs advertised by the origin of a mirror that are mirrored with the refs
+    policy, None if git ls-remote fails. the policy is part of the digest, a fetch follows
+    a change of policy
+    """
+    try:
+        output = git.Repo(repo_path).git.ls_remote("origin")
+    except git.GitCommandError as e:
+        logger.info(f"git ls-remote failed in {repo_path} => {str(e)}")
+        return None
+
+    prefixes = tuple(refspec.split(":")[0].lstrip("+").rstrip("*") for refspec in MIRROR_REFSPECS[refs])
+    lines = sorted(line for line in output.splitlines() if line.split("\t")[-1].startswith(prefixes))
+    return hashlib.sha256("\n".join([refs, *lines]).encode()).hexdigest()
+
+
+def _get_config_(repo_path: str, key: str) -> str | None:
+    try:
+        return git.Repo(repo_path).git.config("--get", key)
+    except git.GitCommandError:
+        return None
+
+
+def set_refspecs(repo_path: str, refs: str) -> bool:
+    """
+    set the fetch refspecs of the origin of a mirror to those of the refs policy and delete
+    the refs not covered by them, which git fetch --prune leaves alone. the objects only
+    reachable from them stay until the next repack. returns True if the refspecs are changed
+    """
+    refspecs = MIRROR_REFSPECS[refs]
+    repo = git.Repo(repo_path)
+    try:
+        current = repo.git.config("--get-all", "remote.origin.fetch").splitlines()
+    except git.GitCommandError:
+        # a bare clone has no fetch refspec
+        current = []
+    if current == refspecs:
+        return False
+
+    repo.git.config("--unset-all", "remote.origin.fetch", with_exceptions=False)
+    for refspec in refspecs:
+        repo.git.config("--add", "remote.origin.fetch", refspec)
+    repo.git.config("remote.origin.mirror", "true")
+
+    prefixes = tuple(refspec.split(":")[-1].rstrip("*") for refspec in refspecs)
+    stale = [ref for ref in repo.git.for_each_ref("--format=%(refname)").splitlines() if not ref.startswith(prefixes)]
+    if stale:
+        commands = "".join(f"delete {ref}\n" for ref in stale)
+        subprocess.run(["git", "update-ref", "--stdin"], cwd=repo_path, input=commands, text=True, check=True)
+        logger.info(f"deleted {len(stale):,} refs not mirrored with policy {refs} from {repo_path}")
+    return True
 
 
 def url_with_token(clone_url: str, repo_source: str) -> str:
@@ -0,0 +1,82 @@
+import os
+import shutil
+from datetime import datetime
+
+from loguru import logger
+from sqlalchemy import and_, delete, exists, select
+from sqlalchemy.orm import Session
+
+from .gitlog import repo_size
+from .models import Mirror, Repository
+from .profiling import RepoProfile
+from .shared_objects import is_shared
+from .utils import clone_url2mirror_path
+
+#
+# the manifest in gi_mirrors has the size, last fetch and last index time of each mirror, updated
+# by the main process after each repository. with a disk budget, the mirrors of inactive
+# repositories are evicted first, then the least recently used, until the total size fits.
+# an evicted mirror is cloned again the next time its repository is processed.
+# mirrors lending objects to forks, see shared_objects.py, are never evicted
+#
+
+
+def update_manifest(session: Session, mirror_path: str, mode: str, profile: RepoProfile) -> None:
+    path = os.path.abspath(clone_url2mirror_path(profile.repo_url, mirror_path))
+    if not os.path.isfile(f"{path}/HEAD"):
+        # a local repository, or the mirror could not be created
+        return
+
+    mirror = session.scalar(select(Mirror).where(Mirror.clone_url == profile.repo_url))
+    if mirror is None:
+        mirror = Mirror(clone_url=profile.repo_url, path=path)
+        session.add(mirror)
+
+    now = datetime.utcnow()
+    mirror.size_bytes = repo_size(path)
+    if "mirror" in profile.timings and profile.outcome != "mirror_failed":
+        mirror.last_fetched_at = now
+    if mode in ["commits", "metrics"] and profile.outcome in ["indexed", "incomplete", "skipped"]:
+        mirror.last_indexed_at = now
+    session.commit()
+
+
+def evict_mirrors(session: Session, budget_bytes: int, mirror_path: str) -> list[str]:
+    """
+    remove mirrors until their total size is within budget_bytes, returns the clone urls of those removed.
+    only directories under mirror_path are deleted, the rows of mirrors elsewhere, e.g. from a run with
+    another --mirror_path, are dropped from the manifest and their directories left alone
+    """
+    mirror_root = os.path.abspath(mirror_path)
+    # several rows in gi_repositories can share a clone url, a mirror is inactive when none of them
+    # is active. not in gi_repositories, e.g. only mirrored so far, counts as active
+    has_repo = exists().where(Repository.clone_url == Mirror.clone_url)
+    has_active_repo = exists().where(Repository.clone_url == Mirror.clone_url, Repository.is_active.is_(True))
+    rows = session.execute(select(Mirror, and_(has_repo, ~has_active_repo))).all()
+    total = sum(mirror.size_bytes for mirror, _ in rows)
+    if total <= budget_bytes:
+        return []
+
+    def last_used(mirror: Mirror) -> datetime:
+        return max(mirror.last_fetched_at or datetime.min, mirror.last_indexed_at or datetime.min)
+
+    candidates = sorted(rows, key=lambda row: (not row[1], last_used(row[0])))
+    evicted = []
+    for mirror, _ in candidates:
+        if total <= budget_bytes:
+            break
+        path = os.path.abspath(mirror.path)
+        if os.path.commonpath([path, mirror_root]) != mirror_root or path == mirror_root:
+            logger.warning(f"mirror {mirror.path} is not under {mirror_root}, removing it from the manifest only")
+        elif os.path.isdir(path):
+            if is_shared(path):
+                continue
+            shutil.rmtree(path)
+        total -= mirror.size_bytes
+        evicted.append(mirror.clone_url)
+        logger.info(f"evicted mirror {mirror.path}, {mirror.size_bytes:,} bytes")
+
+    session.execute(delete(Mirror).where(Mirror.clone_url.in_(evicted)))
+    session.commit()
+    logger.info(f"evicted {len(evicted):,} mirrors, {total:,} bytes left of a budget of {budget_bytes:,}")
+    return evicted
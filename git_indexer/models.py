@@ -1,14 +1,30 @@
 import os
 import re
 from dataclasses import dataclass
+from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, Table
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Integer,
+    String,
+    Table,
+    UniqueConstraint,
+    select,
+    true,
+)
 from sqlalchemy.orm import (
     Mapped,
     Session,
     declarative_base,
     mapped_column,
+    object_session,
     relationship,
 )
 
@@ -59,12 +75,14 @@ class Repository(Base):
     clone_url: Mapped[str] = mapped_column(String(256))
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     last_indexed_at: Mapped[Optional[DateTime]] = mapped_column(DateTime, nullable=True)
-    last_commit_at: Mapped[Optional[DateTime]] = mapped_column(DateTime, nullable=True)
+    last_commit_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
 
     commits: Mapped[list["Commit"]] = relationship(secondary=repo_to_commit_table, back_populates="repos")
 
     merge_requests: Mapped[list["MergeRequest"]] = relationship("MergeRequest", back_populates="repo")
 
+    refs: Mapped[list["RepositoryRef"]] = relationship("RepositoryRef", back_populates="repo")
+
     @property
     def browse_url(self) -> str:
         url = self.clone_url
@@ -99,13 +117,107 @@ class Repository(Base):
         return f"Repository(id={self.id}, url={self.clone_url})"
 
 
+@dataclass
+class RepositoryRef(Base):
+    """tip of a ref when the repository was last indexed, the next run only walks commits not reachable from it"""
+
+    __tablename__ = "gi_repo_refs"
+    __table_args__ = (UniqueConstraint("repo_id", "ref_name", name="uq_gi_repo_refs_repo_id_ref_name"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)  # noqa: A003, VNE003
+    ref_name: Mapped[str] = mapped_column(String(512))
+    sha: Mapped[str] = mapped_column(String(40))
+
+    repo_id: Mapped[int] = mapped_column(Integer, ForeignKey("gi_repositories.id"))
+    repo: Mapped[Repository] = relationship("Repository", back_populates="refs")
+
+
+@dataclass
+class IndexCheckpoint(Base):
+    """
+    progress of indexing a repository that has not completed yet. commits are traversed
+    in a stable order from ref_tips, the first n_done of them are indexed, the last one is last_sha
+    """
+
+    __tablename__ = "gi_index_checkpoints"
+
+    repo_id: Mapped[int] = mapped_column(Integer, ForeignKey("gi_repositories.id"), primary_key=True)
+    ref_tips: Mapped[dict] = mapped_column(JSON)
+    n_done: Mapped[int] = mapped_column(Integer, default=0)
+    last_sha: Mapped[str] = mapped_column(String(40))
+    updated_at: Mapped[datetime] = mapped_column(DateTime)
+
+
+@dataclass
+class IndexRun(Base):
+    """a run of the indexer cli, with totals of the repositories it processed"""
+
+    __tablename__ = "gi_index_runs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)  # noqa: A003, VNE003
+    mode: Mapped[str] = mapped_column(String(16))
+    source: Mapped[str] = mapped_column(String(16))
+    query: Mapped[str] = mapped_column(String(256), default="")
+    started_at: Mapped[datetime] = mapped_column(DateTime)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    duration: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    n_repos: Mapped[int] = mapped_column(Integer, default=0)
+    n_failed: Mapped[int] = mapped_column(Integer, default=0)
+    n_new_commits: Mapped[int] = mapped_column(Integer, default=0)
+    # running, completed or failed
+    outcome: Mapped[str] = mapped_column(String(16), default="running")
+
+
+@dataclass
+class IndexRunRepo(Base):
+    """
+    what a run did with a repository. durations are in seconds, fetch_bytes is how much
+    the mirror grew. repo_id is None when the repository is not in gi_repositories, e.g. in mirror mode
+    """
+
+    __tablename__ = "gi_index_run_repos"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)  # noqa: A003, VNE003
+    run_id: Mapped[int] = mapped_column(Integer, ForeignKey("gi_index_runs.id"), index=True)
+    repo_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("gi_repositories.id"), nullable=True)
+    clone_url: Mapped[str] = mapped_column(String(256))
+    finished_at: Mapped[datetime] = mapped_column(DateTime)
+    duration: Mapped[float] = mapped_column(Float, default=0.0)
+    mirror_duration: Mapped[float] = mapped_column(Float, default=0.0)
+    index_duration: Mapped[float] = mapped_column(Float, default=0.0)
+    n_new_commits: Mapped[int] = mapped_column(Integer, default=0)
+    n_files: Mapped[int] = mapped_column(Integer, default=0)
+    n_rows: Mapped[int] = mapped_column(Integer, default=0)
+    fetch_bytes: Mapped[int] = mapped_column(BigInteger, default=0)
+    # see RepoProfile.outcome
+    outcome: Mapped[str] = mapped_column(String(16))
+    error: Mapped[Optional[str]] = mapped_column(String(1024), nullable=True)
+
+
+@dataclass
+class Mirror(Base):
+    """
+    manifest of the mirrors under --mirror_path, used to evict the least recently used
+    mirrors when they take more than the disk budget. size_bytes is from git count-objects
+    """
+
+    __tablename__ = "gi_mirrors"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)  # noqa: A003, VNE003
+    clone_url: Mapped[str] = mapped_column(String(256), unique=True)
+    path: Mapped[str] = mapped_column(String(512))
+    size_bytes: Mapped[int] = mapped_column(BigInteger, default=0)
+    last_fetched_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    last_indexed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+
 @dataclass
 class Commit(Base):
     __tablename__ = "gi_commits"
 
     sha: Mapped[str] = mapped_column(String(40), primary_key=True)
     message: Mapped[str] = mapped_column(String(2048), default="")
-    created_at: Mapped[DateTime] = mapped_column(DateTime)
+    created_at: Mapped[datetime] = mapped_column(DateTime)
     created_at_tz: Mapped[DateTime] = mapped_column(DateTime(timezone=True))
     is_merge: Mapped[bool] = mapped_column(Boolean, default=False)
     n_lines: Mapped[int] = mapped_column(Integer, default=0)
@@ -116,6 +228,8 @@ class Commit(Base):
     n_lines_ignored: Mapped[int] = mapped_column(Integer, default=0)
     n_files_changed: Mapped[int] = mapped_column(Integer, default=0)
     n_files_ignored: Mapped[int] = mapped_column(Integer, default=0)
+    # False when code metrics of the committed files are not computed yet, see code_metrics.py
+    has_code_metrics: Mapped[bool] = mapped_column(Boolean, default=True, server_default=true())
 
     author_id: Mapped[int] = mapped_column(Integer, ForeignKey("gi_authors.id"))
     author: Mapped[Author] = relationship("Author", back_populates="commits")
@@ -153,13 +267,7 @@ class CommittedFile(Base):
         super().__init__(*args, **kwargs)
 
         if not self.id:
-            main, ext = os.path.splitext(self.file_path)
-            if main.startswith("."):
-                self.file_type = "hidden"
-            elif ext != "":
-                self.file_type = ext[1:].lower()
-            else:
-                self.file_type = "generic"
+            self.file_type = file_type_of(self.file_path)
 
     def __str__(self) -> str:
         return f"CommittedFile(id={self.id}, part of Commit(sha={self.commit_sha}))"
@@ -191,6 +299,16 @@ class MergeRequest(Base):
     repo: Mapped[Repository] = relationship("Repository", back_populates="merge_requests")
 
 
+def file_type_of(file_path: str) -> str:
+    main, ext = os.path.splitext(file_path)
+    if main.startswith("."):
+        return "hidden"
+    elif ext != "":
+        return ext[1:].lower()
+    else:
+        return "generic"
+
+
 def ensure_repository(session: Session, clone_url: str, repo_type: str) -> Repository:
     repo = session.query(Repository).filter_by(clone_url=clone_url, repo_type=repo_type).first()
     if repo is None:
@@ -201,5 +319,32 @@ def ensure_repository(session: Session, clone_url: str, repo_type: str) -> Repos
     return repo
 
 
-def repo_commit_hashes(repo: Repository) -> list[str]:
-    return [c.sha for c in repo.commits]
+def repo_commit_hashes(repo: Repository) -> set[bytes]:
+    """
+    returns the sha of all commits linked to a repository, as a set of
+    20 bytes digests, see sha_digest(). only the commit_id column of
+    the join table is queried, no Commit object is loaded
+    """
+    session = object_session(repo)
+    assert session is not None, f"{repo} is not attached to a session"
+
+    query = (
+        select(repo_to_commit_table.c.commit_id)
+        .where(repo_to_commit_table.c.repo_id == repo.id)
+        .execution_options(yield_per=10000)
+    )
+    return {sha_digest(sha) for sha in session.scalars(query)}
+
+
+def repo_ref_tips(repo: Repository) -> dict[str, str]:
+    """returns ref name => sha of the ref tips stored when the repository was last indexed"""
+    session = object_session(repo)
+    assert session is not None, f"{repo} is not attached to a session"
+
+    query = select(RepositoryRef.ref_name, RepositoryRef.sha).where(RepositoryRef.repo_id == repo.id)
+    return dict(session.execute(query).tuples().all())
+
+
+def sha_digest(sha: str) -> bytes:
+    # 20 bytes instead of a 40 characters hex string
+    return bytes.fromhex(sha)
@@ -0,0 +1,98 @@
+import queue
+import threading
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Any, Callable, Iterator
+
+DEFAULT_QUEUE_SIZE = 4
+
+# how often a blocked producer checks whether the consumer has stopped
+_POLL_INTERVAL_ = 0.1
+
+
+@dataclass
+class PipelineStats:
+    n_items: int = 0
+    # seconds the producer waited for room in the queue, i.e. the consumer is the bottleneck
+    producer_blocked: float = 0.0
+    # seconds the consumer waited for the next item, i.e. the producer is the bottleneck
+    consumer_blocked: float = 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.n_items:,} items, producer blocked {self.producer_blocked:,.2f}s, "
+            f"consumer blocked {self.consumer_blocked:,.2f}s"
+        )
+
+
+@dataclass
+class _Failed_:
+    error: BaseException
+
+
+_DONE_ = object()
+
+
+def run_pipeline(
+    items: Iterator[Any],
+    consume: Callable[[Any], None],
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    stats: PipelineStats | None = None,
+) -> PipelineStats:
+    """
+    iterate items in a producer thread and consume them in the calling thread,
+    connected by a queue of at most queue_size items. the producer blocks when
+    the queue is full. an exception in either stage stops both, the producer
+    is closed in its own thread and the exception is raised here
+    """
+    stats = stats if stats is not None else PipelineStats()
+    items_queue: queue.Queue = queue.Queue(maxsize=max(queue_size, 1))
+    stopped = threading.Event()
+
+    def put(item: Any) -> bool:
+        start = perf_counter()
+        try:
+            while not stopped.is_set():
+                try:
+                    items_queue.put(item, timeout=_POLL_INTERVAL_)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            stats.producer_blocked += perf_counter() - start
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put(item):
+                    break
+            else:
+                put(_DONE_)
+        except BaseException as e:
+            put(_Failed_(e))
+        finally:
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+
+    producer = threading.Thread(target=produce, name="pipeline-producer", daemon=True)
+    producer.start()
+    try:
+        while True:
+            start = perf_counter()
+            item = items_queue.get()
+            stats.consumer_blocked += perf_counter() - start
+
+            if item is _DONE_:
+                break
+            elif isinstance(item, _Failed_):
+                raise item.error
+
+            consume(item)
+            stats.n_items += 1
+    finally:
+        stopped.set()
+        producer.join()
+
+    return stats
@@ -0,0 +1,159 @@
+import cProfile
+import os
+import re
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Iterator, TypeVar
+
+from loguru import logger
+
+from .utils import display_url
+
+# stages of processing a repository, in the order they happen
+STAGES = ["enumerate", "mirror", "traverse", "extract", "authors", "write"]
+
+#   indexed         new commits indexed, or the code metrics computed in metrics mode
+#   incomplete      indexing stopped on timeout or memory limit, to be resumed by the next run
+#   skipped         no ref changed since last indexed, or the repository is inactive
+#   mirrored        mirror created or updated in mirror mode
+#   mirror_failed   unable to clone or fetch the mirror
+#   maintained      commit-graph written and mirror repacked in maintain mode
+#   failed          any other error
+OUTCOMES = ["indexed", "incomplete", "skipped", "mirrored", "mirror_failed", "maintained", "failed"]
+
+T = TypeVar("T")
+
+# stages being timed by each thread, innermost last, as [name, seconds spent in nested stages]
+_stack_ = threading.local()
+_lock_ = threading.Lock()
+
+
+@dataclass
+class RepoProfile:
+    """
+    cumulative seconds spent in each stage for a repository. time spent in a
+    stage nested in another, e.g. authors in write, only counts towards the
+    inner one. with a pipeline, stages of the producer thread overlap with
+    write and the total can be more than the elapsed time.
+
+    also keeps what was done with the repository, for the run history:
+    counts of commits, files, rows and fetch_bytes, the wall clock seconds
+    spent on it and the outcome, one of OUTCOMES
+    """
+
+    repo_url: str
+    timings: dict[str, float] = field(default_factory=dict)
+    counts: dict[str, int] = field(default_factory=dict)
+    elapsed: float = 0.0
+    outcome: str = ""
+    error: str | None = None
+
+    @property
+    def total(self) -> float:
+        return sum(self.timings.values())
+
+    def add(self, name: str, seconds: float) -> None:
+        with _lock_:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def count(self, name: str, amount: int) -> None:
+        with _lock_:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def failed(self, error: BaseException) -> None:
+        self.outcome = "failed"
+        self.error = f"{type(error).__name__}: {str(error)}"[:1024]
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        stack = _thread_stack_()
+        frame = [name, 0.0]
+        stack.append(frame)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1][1] += elapsed
+            self.add(name, elapsed - frame[1])  # type: ignore
+
+    def iterate(self, name: str, items: Iterator[T]) -> Iterator[T]:
+        """yield from items, time spent getting each item counts towards the stage"""
+        iterator = iter(items)
+        try:
+            while True:
+                with self.stage(name):
+                    item = next(iterator, _END_)
+                if item is _END_:
+                    return
+                yield item  # type: ignore
+        finally:
+            # e.g. a generator that cleans up when closed
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def __str__(self) -> str:
+        stages = ", ".join(f"{name} {self.timings[name]:,.2f}s" for name in STAGES if name in self.timings)
+        return f"{self.total:,.2f}s: {stages}"
+
+
+_END_ = object()
+
+
+def timed(items: Iterator[T]) -> Iterator[tuple[T, float]]:
+    """yield each item with the seconds spent getting it"""
+    iterator = iter(items)
+    while True:
+        start = perf_counter()
+        item = next(iterator, _END_)
+        if item is _END_:
+            return
+        yield item, perf_counter() - start  # type: ignore
+
+
+def _thread_stack_() -> list[list]:
+    if not hasattr(_stack_, "frames"):
+        _stack_.frames = []
+    return _stack_.frames
+
+
+@contextmanager
+def cprofile_to(profile_dir: str, repo_url: str) -> Iterator[None]:
+    """run the block with cProfile and dump the stats into profile_dir, no profiling if empty"""
+    if not profile_dir:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(profile_dir, exist_ok=True)
+        profiler.dump_stats(f"{profile_dir}/{profile_file_name(repo_url)}")
+
+
+def profile_file_name(repo_url: str) -> str:
+    name = re.sub(r"[^\w.-]+", "_", display_url(repo_url, max_length=200)).strip("_")
+    return f"{name}.prof"
+
+
+def log_profile_summary(profiles: list[RepoProfile], n_slowest: int = 10) -> None:
+    """log the total time of each stage across repositories, then the slowest repositories"""
+    if not profiles:
+        return
+
+    totals = RepoProfile("all")
+    for profile in profiles:
+        for name, seconds in profile.timings.items():
+            totals.add(name, seconds)
+    logger.info(f"profile of {len(profiles):,} repositories, {totals}")
+
+    for profile in sorted(profiles, key=lambda p: p.total, reverse=True)[:n_slowest]:
+        logger.info(f"  {display_url(profile.repo_url)} {profile}")
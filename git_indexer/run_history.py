@@ -0,0 +1,115 @@
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, desc, func, select, update
+from sqlalchemy.orm import Session
+
+from .models import IndexRun, IndexRunRepo, Repository
+from .profiling import RepoProfile
+from .utils import display_url
+
+# stages of index_commits, see profiling.STAGES
+_INDEX_STAGES_ = ["traverse", "extract", "authors", "write"]
+
+
+def start_run(session: Session, options: argparse.Namespace) -> int:
+    """records the start of a run, returns its id"""
+    run = IndexRun(
+        mode=options.mode,
+        source=options.source,
+        query=options.query[:256],
+        started_at=datetime.utcnow(),
+        outcome="running",
+    )
+    session.add(run)
+    session.commit()
+    return run.id
+
+
+def record_repo_run(session: Session, run_id: int, profile: RepoProfile) -> None:
+    """records what the run did with a repository, from the profile filled in while processing it"""
+    repo_id = session.scalar(select(Repository.id).where(Repository.clone_url == profile.repo_url).limit(1))
+    session.add(
+        IndexRunRepo(
+            run_id=run_id,
+            repo_id=repo_id,
+            clone_url=profile.repo_url[:256],
+            finished_at=datetime.utcnow(),
+            duration=profile.elapsed,
+            mirror_duration=profile.timings.get("mirror", 0.0),
+            index_duration=sum(profile.timings.get(name, 0.0) for name in _INDEX_STAGES_),
+            n_new_commits=profile.counts.get("commits", 0),
+            n_files=profile.counts.get("files", 0),
+            n_rows=profile.counts.get("rows", 0),
+            fetch_bytes=profile.counts.get("fetch_bytes", 0),
+            outcome=profile.outcome or "failed",
+            error=profile.error,
+        )
+    )
+    session.commit()
+
+
+def finish_run(session: Session, run_id: int, outcome: str) -> None:
+    """records the end of a run, with totals of the repositories recorded for it"""
+    n_repos, n_failed, n_new_commits = session.execute(
+        select(
+            func.count(IndexRunRepo.id),
+            func.coalesce(func.sum(case((IndexRunRepo.outcome.in_(["failed", "mirror_failed"]), 1), else_=0)), 0),
+            func.coalesce(func.sum(IndexRunRepo.n_new_commits), 0),
+        ).where(IndexRunRepo.run_id == run_id)
+    ).one()
+    run = session.get(IndexRun, run_id)
+    finished_at = datetime.utcnow()
+    session.execute(
+        update(IndexRun)
+        .where(IndexRun.id == run_id)
+        .values(
+            finished_at=finished_at,
+            duration=(finished_at - run.started_at).total_seconds(),  # type: ignore
+            n_repos=n_repos,
+            n_failed=n_failed,
+            n_new_commits=n_new_commits,
+            outcome=outcome,
+        )
+    )
+    session.commit()
+
+
+def slowest_repos(session: Session, since: datetime, limit: int = 10) -> list[tuple[str, int, float, float]]:
+    """returns clone_url, number of runs, average and max seconds, of the repositories slowest on average"""
+    avg_duration = func.avg(IndexRunRepo.duration)
+    query = (
+        select(IndexRunRepo.clone_url, func.count(IndexRunRepo.id), avg_duration, func.max(IndexRunRepo.duration))
+        .where(IndexRunRepo.finished_at >= since)
+        .group_by(IndexRunRepo.clone_url)
+        .order_by(desc(avg_duration))
+        .limit(limit)
+    )
+    return list(session.execute(query).tuples())
+
+
+def fastest_growing_repos(session: Session, since: datetime, limit: int = 10) -> list[tuple[str, int, int, int]]:
+    """returns clone_url, new commits, committed files and fetched bytes, of the repositories with most new commits"""
+    n_commits = func.sum(IndexRunRepo.n_new_commits)
+    query = (
+        select(IndexRunRepo.clone_url, n_commits, func.sum(IndexRunRepo.n_files), func.sum(IndexRunRepo.fetch_bytes))
+        .where(IndexRunRepo.finished_at >= since)
+        .group_by(IndexRunRepo.clone_url)
+        .order_by(desc(n_commits))
+        .limit(limit)
+    )
+    return list(session.execute(query).tuples())
+
+
+def print_report(session: Session, days: int = 30, limit: int = 10) -> None:
+    since = datetime.utcnow() - timedelta(days=days)
+    n_runs = session.scalar(select(func.count(IndexRun.id)).where(IndexRun.started_at >= since))
+    print(f"{n_runs:,} runs in the last {days} days")
+
+    print(f"\nslowest repositories\n{'repository':<64} {'runs':>6} {'avg secs':>10} {'max secs':>10}")
+    for clone_url, n_runs_of_repo, avg_seconds, max_seconds in slowest_repos(session, since, limit):
+        print(f"{display_url(clone_url):<64} {n_runs_of_repo:>6,} {avg_seconds:>10,.1f} {max_seconds:>10,.1f}")
+
+    print(f"\nfastest growing repositories\n{'repository':<64} {'commits':>8} {'files':>10} {'fetched MB':>10}")
+    for clone_url, n_commits, n_files, fetch_bytes in fastest_growing_repos(session, since, limit):
+        print(f"{display_url(clone_url):<64} {n_commits:>8,} {n_files:>10,} {fetch_bytes / 2**20:>10,.1f}")
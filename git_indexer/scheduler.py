@@ -0,0 +1,63 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from typing import Callable, Iterator
+from urllib.parse import urlparse
+
+
+def repo_host(repo_url: str) -> str:
+    """host name of a remote repo url, empty string for a local path"""
+    if "://" not in repo_url:
+        # scp like syntax, e.g. git@gitlab.com:group/repo.git
+        return repo_url.split("@", 1)[-1].split(":", 1)[0] if ":" in repo_url else ""
+    return urlparse(repo_url).hostname or ""
+
+
+class HostLimitedExecutor:
+    """
+    submits tasks to an executor with at most max_per_host of them queued or running
+    for the same host, 0 means no limit. tasks over the limit are held back in the
+    order they are submitted until a task for the same host completes, so that a
+    large pool does not open more connections to one server than it allows.
+    the empty host of local repos, see repo_host, is not limited
+    """
+
+    def __init__(self, executor: Executor, max_per_host: int = 0):
+        self.executor = executor
+        self.max_per_host = max_per_host
+        self._futures: dict[Future, str] = {}
+        self._running: dict[str, int] = {}
+        self._held: dict[str, deque] = {}
+
+    def submit(self, host: str, fn: Callable, *args) -> None:
+        if self.max_per_host and host and self._running.get(host, 0) >= self.max_per_host:
+            self._held.setdefault(host, deque()).append((fn, args))
+        else:
+            self._submit_(host, fn, args)
+
+    def _submit_(self, host: str, fn: Callable, args: tuple) -> None:
+        self._running[host] = self._running.get(host, 0) + 1
+        self._futures[self.executor.submit(fn, *args)] = host
+
+    def _release_(self, host: str) -> None:
+        self._running[host] -= 1
+        held = self._held.get(host)
+        if held:
+            fn, args = held.popleft()
+            self._submit_(host, fn, args)
+
+    def n_pending(self) -> int:
+        """number of tasks submitted but not completed yet, including those held back"""
+        return len(self._futures) + sum(len(held) for held in self._held.values())
+
+    def completed(self, timeout: float | None = None) -> Iterator[Future]:
+        """
+        yields futures as they complete. returns when all tasks have completed,
+        or when none completes within timeout seconds if a timeout is given
+        """
+        while self._futures:
+            done, _ = wait(list(self._futures), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                return
+            for future in done:
+                self._release_(self._futures.pop(future))
+                yield future
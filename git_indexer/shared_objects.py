@@ -0,0 +1,92 @@
+import os
+
+import git
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .gitlog import repo_size
+from .models import Repository, repo_to_commit_table
+from .utils import clone_url2mirror_path
+
+#
+# forks share most of their objects with the repository they were forked from. a fork mirror
+# can borrow objects from the mirror of another repository through objects/info/alternates,
+# after which a local repack drops the objects it can borrow and fetches only ask for what is
+# missing from both.
+#
+# the repository borrowed from is the one with the lowest id having commits in common in
+# gi_repo_to_commits. a mirror only ever borrows from a repository with a lower id, so
+# alternates never form a cycle. a mirror lending objects is marked with gitindexer.shared,
+# it keeps unreachable objects when repacked and is never pruned, since a fork may need them.
+#
+SHARED_KEY = "gitindexer.shared"
+
+
+def find_origins(session: Session, repo_url: str) -> list[str]:
+    """
+    clone urls of repositories with a lower id than repo_url and commits in common with it,
+    lowest id first. empty if repo_url is not indexed yet
+    """
+    repo_id = session.scalar(select(Repository.id).where(Repository.clone_url == repo_url))
+    if repo_id is None:
+        return []
+
+    other = repo_to_commit_table.alias()
+    commits_of_repo = select(repo_to_commit_table.c.commit_id).where(repo_to_commit_table.c.repo_id == repo_id)
+    origin_ids = (
+        select(other.c.repo_id)
+        .where(other.c.repo_id < repo_id, other.c.commit_id.in_(commits_of_repo))
+        .distinct()
+        .scalar_subquery()
+    )
+    query = select(Repository.clone_url).where(Repository.id.in_(origin_ids)).order_by(Repository.id)
+    return list(session.scalars(query))
+
+
+def alternates_of(repo_path: str) -> list[str]:
+    alternates_file = f"{repo_path}/objects/info/alternates"
+    if not os.path.isfile(alternates_file):
+        return []
+    with open(alternates_file) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def is_shared(repo_path: str) -> bool:
+    try:
+        return git.Repo(repo_path).git.config("--get", SHARED_KEY) == "true"
+    except (git.GitCommandError, git.InvalidGitRepositoryError, git.NoSuchPathError):
+        return False
+
+
+def share_objects(repo_path: str, origin_path: str) -> bool:
+    """
+    make the mirror in repo_path borrow objects from the mirror in origin_path and drop
+    its own copies of them. returns False if it already borrows from somewhere
+    """
+    if alternates_of(repo_path):
+        return False
+
+    origin = git.Repo(origin_path)
+    origin.git.config(SHARED_KEY, "true")
+    # gc --auto after a fetch would otherwise prune unreachable objects a fork still uses
+    origin.git.config("gc.pruneExpire", "never")
+
+    size_before = repo_size(repo_path)
+    with open(f"{repo_path}/objects/info/alternates", "w") as f:
+        f.write(os.path.abspath(f"{origin_path}/objects") + "\n")
+    # -l leaves out the objects found in the alternate
+    git.Repo(repo_path).git.repack("-a", "-d", "-l", "-q")
+    logger.info(
+        f"{repo_path} now shares objects with {origin_path}, size {size_before:,} -> {repo_size(repo_path):,} bytes"
+    )
+    return True
+
+
+def share_with_origin(session: Session, repo_url: str, repo_path: str, mirror_path: str) -> bool:
+    """share objects with the first origin of repo_url that has a mirror, returns True if it starts sharing"""
+    for origin_url in find_origins(session, repo_url):
+        origin_path = os.path.abspath(clone_url2mirror_path(origin_url, mirror_path))
+        if os.path.isfile(f"{origin_path}/HEAD"):
+            return share_objects(repo_path, origin_path)
+    return False
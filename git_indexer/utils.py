@@ -1,28 +1,33 @@
 import fnmatch
+import itertools
 import os
 import pathlib
 import re
+import resource
 import urllib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from typing import Any, Iterator, Optional
 
 from github import Auth, BadCredentialsException, Github
 from gitlab import Gitlab
+from gitlab.base import RESTObjectList
 from loguru import logger
 
-# files matches any of the regex will not be counted
-# towards commit stats
-_IGNORE_PATTERNS_ = [
-    re.compile(
-        "^(vendor|Pods|target|YoutuOCWrapper|vos-app-protection|vos-processor|\\.idea|\\.vscode)/."  # noqa: E501
-    ),
-    re.compile("^[a-zA-Z0-9_]*?/Pods/"),
-    re.compile("^.*(xcodeproj|xcworkspace)/."),
-    re.compile(r".*\.(jar|pbxproj|lock|bk|bak|backup|class|swp|sum|pdf|png)$"),
-    re.compile(r"^.*/?package-lock\.json$"),
-    re.compile(r"^.*/?(\.next|node_modules|\.devcontainer)(/|$).*"),
-    re.compile(r"(^|.*/)_.*\.(js|scss)$"),
-]
+from .exclusions import default_excluder
+
+GITLAB_PAGE_SIZE = 100
+# pages of gitlab projects fetched at the same time
+GITLAB_PAGE_WORKERS = 4
+
+
+def rss_mb() -> float:
+    """resident memory of this process in MB, the peak where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
 
 
 def match_any(path: str, patterns: str) -> bool:
@@ -34,10 +39,7 @@ def should_exclude_from_stats(path: str) -> bool:
     return true if the path should be ignore
     for calculating commit stats
     """
-    for regex in _IGNORE_PATTERNS_:
-        if regex.match(path):
-            return True
-    return False
+    return default_excluder().is_excluded(path)
 
 
 def __shorten__(path: str, max_lenght: int) -> str:
@@ -95,11 +97,35 @@ def enumerate_gitlab_repos(
             logger.info("GITLAB_TOKEN environment variable not set")
             return
 
-    gl = Gitlab(url, private_token=private_token, per_page=20)
-    for project in gl.search(scope="projects", search=query, iterator=True):
-        repo = gl.projects.get(project["id"])
-        clone_url = repo.http_url_to_repo
-        yield clone_url, repo
+    gl = Gitlab(url, private_token=private_token, per_page=GITLAB_PAGE_SIZE)
+    for project in _list_gitlab_projects_(gl, query):
+        yield project.http_url_to_repo, project
+
+
+def _list_gitlab_projects_(gl: Gitlab, query: str) -> Iterator[Any]:
+    """
+    projects matching query in their name or namespace path. projects in a page of the list
+    already have http_url_to_repo and visibility, and can list their merge requests, so there
+    is no request per project. pages after the first are fetched concurrently when gitlab
+    returns the number of pages, which it does not for more than 10,000 projects
+    """
+    params = {"search": query, "search_namespaces": True, "order_by": "id", "sort": "asc"}
+    first_page = gl.projects.list(iterator=True, **params)
+    assert isinstance(first_page, RESTObjectList)
+    total_pages = first_page.total_pages
+    if not total_pages:
+        yield from first_page
+        return
+
+    # stop at the end of the first page, iterating further fetches the next one
+    yield from itertools.islice(first_page, first_page.per_page)
+    with ThreadPoolExecutor(max_workers=GITLAB_PAGE_WORKERS) as executor:
+        pages = executor.map(
+            lambda page_no: gl.projects.list(page=page_no, get_all=False, **params),
+            range(2, total_pages + 1),
+        )
+        for projects in pages:
+            yield from projects
 
 
 def enumerate_github_repos(
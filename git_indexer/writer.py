@@ -0,0 +1,113 @@
+from time import perf_counter
+from typing import Any, Callable
+
+from loguru import logger
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .metrics import WRITE_DURATION
+from .models import Commit, CommittedFile, repo_to_commit_table
+
+DEFAULT_BATCH_SIZE = 500
+
+
+class BatchWriter:
+    """
+    buffers new commits, their committed files and the links between
+    repositories and commits, then writes them with one executemany
+    INSERT per table and a single transaction commit per batch.
+
+    a batch_size of 1 gives the same commit-per-commit behavior
+    as the ORM write path.
+
+    on_flush is called with the progress passed with the last link of
+    a batch, before the batch is committed, e.g. to save a checkpoint
+    in the same transaction. objects of expunge_types are removed from
+    the session after each batch so that its identity map does not grow
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        on_flush: Callable[[Any], None] | None = None,
+        expunge_types: tuple[type, ...] = (),
+    ):
+        self.session = session
+        self.batch_size = max(batch_size, 1)
+        self.on_flush = on_flush
+        self.expunge_types = expunge_types
+        self.n_rows_written = 0
+        self._commits: list[dict[str, Any]] = []
+        self._files: list[dict[str, Any]] = []
+        self._links: list[dict[str, Any]] = []
+        self._progress: Any = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._links)
+
+    def add_commit(self, commit_row: dict[str, Any], file_rows: list[dict[str, Any]]) -> None:
+        self._commits.append(commit_row)
+        self._files.extend(file_rows)
+
+    def add_link(self, repo_id: int, sha: str, progress: Any = None) -> bool:
+        """
+        link a commit to a repository. the commit is either added to this
+        writer before or already exists in database.
+        returns True if the buffer was flushed as a result
+        """
+        self._links.append({"repo_id": repo_id, "commit_id": sha})
+        self._progress = progress
+        if self.pending >= self.batch_size:
+            self.flush()
+            return True
+        return False
+
+    def flush(self) -> None:
+        if not self._links and not self._commits:
+            return
+
+        start = perf_counter()
+        try:
+            self._write_()
+        except IntegrityError:
+            # another process indexing a fork of the same repo may have written
+            # some of these commits after we checked. drop them and try again
+            self.session.rollback()
+            self._drop_existing_commits_()
+            self._write_()
+        WRITE_DURATION.observe(perf_counter() - start)
+
+        n_rows = len(self._commits) + len(self._files) + len(self._links)
+        logger.debug(f"flushed {len(self._links)} commits, {n_rows} rows to database")
+        self.n_rows_written += n_rows
+
+        self._commits.clear()
+        self._files.clear()
+        self._links.clear()
+        self._progress = None
+
+    def _write_(self) -> None:
+        # order matters, both files and links reference gi_commits.sha
+        if self._commits:
+            self.session.execute(insert(Commit), self._commits)
+        if self._files:
+            self.session.execute(insert(CommittedFile), self._files)
+        if self._links:
+            self.session.execute(insert(repo_to_commit_table), self._links)
+        if self.on_flush is not None and self._progress is not None:
+            self.on_flush(self._progress)
+        self.session.commit()
+        if self.expunge_types:
+            for obj in list(self.session.identity_map.values()):
+                if isinstance(obj, self.expunge_types):
+                    self.session.expunge(obj)
+
+    def _drop_existing_commits_(self) -> None:
+        shas = [row["sha"] for row in self._commits]
+        existing = set(self.session.scalars(select(Commit.sha).where(Commit.sha.in_(shas))))
+        logger.info(f"{len(existing)} commits were written by another process, skipping them")
+        self._commits = [row for row in self._commits if row["sha"] not in existing]
+        self._files = [row for row in self._files if row["commit_sha"] not in existing]
@@ -0,0 +1,38 @@
+"""create repo refs table
+
+Revision ID: 3f7a1c9e2b64
+Revises: 9d4b7e2c5a18
+Create Date: 2026-10-16 22:41:09.517330
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3f7a1c9e2b64"
+down_revision: Union[str, None] = "9d4b7e2c5a18"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "gi_repo_refs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("ref_name", sa.String(length=512), nullable=False),
+        sa.Column("sha", sa.String(length=40), nullable=False),
+        sa.Column("repo_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["repo_id"],
+            ["gi_repositories.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("repo_id", "ref_name", name="uq_gi_repo_refs_repo_id_ref_name"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("gi_repo_refs")
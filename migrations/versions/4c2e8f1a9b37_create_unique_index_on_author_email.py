@@ -0,0 +1,29 @@
+"""create unique index on author.email
+
+Revision ID: 4c2e8f1a9b37
+Revises: df16528d0035
+Create Date: 2026-10-16 21:05:12.418305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "4c2e8f1a9b37"
+down_revision: Union[str, None] = "df16528d0035"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # revision df16528d0035 was generated empty, the unique index was never created
+    with op.batch_alter_table("gi_authors") as batch_op:
+        batch_op.create_unique_constraint("uq_gi_authors_email", ["email"])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("gi_authors") as batch_op:
+        batch_op.drop_constraint("uq_gi_authors_email", type_="unique")
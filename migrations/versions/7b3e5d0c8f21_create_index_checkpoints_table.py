@@ -0,0 +1,38 @@
+"""create index checkpoints table
+
+Revision ID: 7b3e5d0c8f21
+Revises: 3f7a1c9e2b64
+Create Date: 2026-10-16 23:20:44.186512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "7b3e5d0c8f21"
+down_revision: Union[str, None] = "3f7a1c9e2b64"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "gi_index_checkpoints",
+        sa.Column("repo_id", sa.Integer(), nullable=False),
+        sa.Column("ref_tips", sa.JSON(), nullable=False),
+        sa.Column("n_done", sa.Integer(), nullable=False),
+        sa.Column("last_sha", sa.String(length=40), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["repo_id"],
+            ["gi_repositories.id"],
+        ),
+        sa.PrimaryKeyConstraint("repo_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("gi_index_checkpoints")
@@ -0,0 +1,28 @@
+"""add has_code_metrics to commits
+
+Revision ID: 9d4b7e2c5a18
+Revises: 4c2e8f1a9b37
+Create Date: 2026-10-16 22:14:37.902113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9d4b7e2c5a18"
+down_revision: Union[str, None] = "4c2e8f1a9b37"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # existing commits were indexed with code metrics
+    op.add_column("gi_commits", sa.Column("has_code_metrics", sa.Boolean(), server_default=sa.true(), nullable=False))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("gi_commits") as batch_op:
+        batch_op.drop_column("has_code_metrics")
@@ -0,0 +1,69 @@
+"""create index runs tables
+
+Revision ID: a5c91d3e7f42
+Revises: 7b3e5d0c8f21
+Create Date: 2026-10-17 00:12:31.640275
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a5c91d3e7f42"
+down_revision: Union[str, None] = "7b3e5d0c8f21"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "gi_index_runs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("mode", sa.String(length=16), nullable=False),
+        sa.Column("source", sa.String(length=16), nullable=False),
+        sa.Column("query", sa.String(length=256), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=False),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.Column("duration", sa.Float(), nullable=True),
+        sa.Column("n_repos", sa.Integer(), nullable=False),
+        sa.Column("n_failed", sa.Integer(), nullable=False),
+        sa.Column("n_new_commits", sa.Integer(), nullable=False),
+        sa.Column("outcome", sa.String(length=16), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "gi_index_run_repos",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("run_id", sa.Integer(), nullable=False),
+        sa.Column("repo_id", sa.Integer(), nullable=True),
+        sa.Column("clone_url", sa.String(length=256), nullable=False),
+        sa.Column("finished_at", sa.DateTime(), nullable=False),
+        sa.Column("duration", sa.Float(), nullable=False),
+        sa.Column("mirror_duration", sa.Float(), nullable=False),
+        sa.Column("index_duration", sa.Float(), nullable=False),
+        sa.Column("n_new_commits", sa.Integer(), nullable=False),
+        sa.Column("n_files", sa.Integer(), nullable=False),
+        sa.Column("n_rows", sa.Integer(), nullable=False),
+        sa.Column("fetch_bytes", sa.BigInteger(), nullable=False),
+        sa.Column("outcome", sa.String(length=16), nullable=False),
+        sa.Column("error", sa.String(length=1024), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["repo_id"],
+            ["gi_repositories.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["run_id"],
+            ["gi_index_runs.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_gi_index_run_repos_run_id"), "gi_index_run_repos", ["run_id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_gi_index_run_repos_run_id"), table_name="gi_index_run_repos")
+    op.drop_table("gi_index_run_repos")
+    op.drop_table("gi_index_runs")
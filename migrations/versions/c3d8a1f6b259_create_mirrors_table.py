@@ -0,0 +1,36 @@
+"""create mirrors table
+
+Revision ID: c3d8a1f6b259
+Revises: a5c91d3e7f42
+Create Date: 2026-10-17 02:41:09.118422
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c3d8a1f6b259"
+down_revision: Union[str, None] = "a5c91d3e7f42"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "gi_mirrors",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("clone_url", sa.String(length=256), nullable=False),
+        sa.Column("path", sa.String(length=512), nullable=False),
+        sa.Column("size_bytes", sa.BigInteger(), nullable=False),
+        sa.Column("last_fetched_at", sa.DateTime(), nullable=True),
+        sa.Column("last_indexed_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("clone_url"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("gi_mirrors")
@@ -47,19 +47,19 @@ def seed_data(session: Session):
     commit1 = Commit(
         sha="feb3a2837630c0e51447fc1d7e68d86f964a8440",
         author=me,
-        created_at=now,  # type: ignore
+        created_at=now,
         created_at_tz=now,  # type: ignore
     )
     commit2 = Commit(
         sha="ee474544052762d314756bb7439d6dab73221d3d",
         author=me,
-        created_at=now,  # type: ignore
+        created_at=now,
         created_at_tz=now,  # type: ignore
     )
     commit3 = Commit(
         sha="e2c8b79813b95c93e5b06c5a82e4c417d5020762",
         author=me,
-        created_at=now,  # type: ignore
+        created_at=now,
         created_at_tz=now,  # type: ignore
     )
 
@@ -0,0 +1,42 @@
+from sqlalchemy.orm import sessionmaker
+
+from git_indexer.authors import AuthorCache
+from git_indexer.models import Author
+
+
+def test_author_cache(session):
+    cache = AuthorCache(maxsize=2)
+    cache.warm(session)
+    assert len(cache) <= 2
+
+    me_id = cache.author_id(session, "mini@me", "me")
+    assert me_id == session.query(Author).filter_by(email="mini@me").first().id
+
+    new_id = cache.author_id(session, "new_author@me", "new author")
+    assert session.query(Author).filter_by(email="new_author@me").first().id == new_id
+
+    # 2nd lookup is served from cache
+    hits = cache.hits
+    assert cache.author_id(session, "new_author@me", "new author") == new_id
+    assert cache.hits == hits + 1
+
+    # least recently used entry is evicted
+    cache.author_id(session, "another_author@me", "another author")
+    assert len(cache) == 2
+    assert "mini@me" not in cache._ids
+
+
+def test_author_cache_concurrent_insert(session, sql_engine, mocker):
+    with sessionmaker(bind=sql_engine)() as other_session:
+        racer = Author(name="racer", email="racer@me")
+        other_session.add(racer)
+        other_session.commit()
+        racer_id = racer.id
+
+    # the author does not exist when we look it up, but is inserted by
+    # another process before our insert
+    mocker.patch.object(session, "scalar", side_effect=[None, racer_id])
+
+    cache = AuthorCache()
+    assert cache.author_id(session, "racer@me", "racer") == racer_id
+    assert session.query(Author).filter_by(email="racer@me").count() == 1
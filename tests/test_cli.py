@@ -2,8 +2,12 @@ import os
 import shlex
 
 import pytest
+from loguru import logger
 
-from git_indexer.cli import main, parse_options
+from git_indexer import metrics
+from git_indexer.cli import _index_repository_worker_, main, parse_options
+from git_indexer.models import Repository
+from git_indexer.profiling import RepoProfile
 
 
 def test_cmdline_options():
@@ -40,6 +44,19 @@ def test_index_from_list(tmp_path, sql_engine):
     main(argv=argv)
 
 
+def test_index_with_workers(tmp_path, local_repo, sql_engine, session):
+    list_file = tmp_path / "local.lst"
+    list_file.write_text(f"{local_repo}/repo1,n,local\n{local_repo}/repo1_fork,n,local\n")
+
+    argv = shlex.split(f"--mode commits --source list --query {list_file} --mirror_path {tmp_path} --workers 2")
+    main(argv=argv)
+
+    repo1 = session.query(Repository).filter_by(clone_url=f"{local_repo}/repo1").first()
+    repo1_fork = session.query(Repository).filter_by(clone_url=f"{local_repo}/repo1_fork").first()
+    assert len(repo1.commits) == 2
+    assert len(repo1_fork.commits) == 3
+
+
 def test_cmdline_mode_mirror(mytest_dir, sql_engine, mocker):
     # running mirror only should only trigger calls to mirror_repo
     # no other calls
@@ -83,7 +100,7 @@ def mocks(mocker):
         def __init__(self, mocker):
             self.mirror_repo = mocker.patch(
                 "git_indexer.cli.mirror_repo",
-                return_value=("some_path", {}),
+                return_value=("some_path", False),
             )
             self.index_commits = mocker.patch(
                 "git_indexer.cli.index_commits",
@@ -95,3 +112,45 @@ def mocks(mocker):
             )
 
     return MyMocks(mocker)
+
+
+def test_mirror_with_workers(tmp_path, local_repo, sql_engine):
+    # repos with a source other than local are mirrored, here from local paths by threads
+    list_file = tmp_path / "mirror.lst"
+    list_file.write_text(f"{local_repo}/repo1,n,file\n{local_repo}/repo1_fork,n,file\n")
+    mirror_path = tmp_path / "mirror"
+
+    argv = shlex.split(f"--mode mirror --source list --query {list_file} --mirror_path {mirror_path} --workers 2")
+    main(argv=argv)
+
+    assert len(list(mirror_path.glob("**/HEAD"))) == 2
+
+
+def test_mirror_worker_keeps_metrics(mocker):
+    # mirror workers are threads of this process, taking values would drain the registry they share
+    index_repository = mocker.patch("git_indexer.cli.index_repository", return_value=0)
+    options = parse_options(shlex.split("--mode mirror --source list --query some.lst --mirror_path /mirror"))
+    metrics.ERRORS.inc(stage="test_worker", type="Thread")
+    before = metrics.ERRORS.total()
+
+    result = _index_repository_worker_(options, "/repo", "local", False, False, RepoProfile("/repo"), False)
+    assert result[2] is None and result[-1] == {}
+    assert metrics.ERRORS.total() == before
+    assert index_repository.call_args.args[0] is None
+
+
+def test_gitlog_engine_warns_once(tmp_path, local_repo, sql_engine):
+    list_file = tmp_path / "local.lst"
+    list_file.write_text(f"{local_repo}/repo1,n,local\n{local_repo}/repo1_fork,n,local\n")
+    warnings: list[str] = []
+    sink_id = logger.add(lambda message: warnings.append(message), level="WARNING", format="{message}")
+    try:
+        main(
+            argv=shlex.split(
+                f"--mode commits --source list --query {list_file} --mirror_path {tmp_path} --engine gitlog"
+            )
+        )
+    finally:
+        logger.remove(sink_id)
+
+    assert len([warning for warning in warnings if "does not compute code metrics" in warning]) == 1
@@ -0,0 +1,73 @@
+import os
+import subprocess
+
+import pytest
+from sqlalchemy import select
+
+from git_indexer.code_metrics import (
+    index_code_metrics,
+    is_valid_policy,
+    wants_code_metrics,
+)
+from git_indexer.commit_indexer import index_commits
+from git_indexer.models import Commit, CommittedFile
+
+
+@pytest.fixture
+def python_repo(tmp_path):
+    repo_path = tmp_path / "python_repo"
+    repo_path.mkdir()
+    env = dict(os.environ, GIT_AUTHOR_NAME="me", GIT_AUTHOR_EMAIL="me@example.com")
+    env.update(GIT_COMMITTER_NAME="me", GIT_COMMITTER_EMAIL="me@example.com")
+
+    def git(*args):
+        subprocess.run(["git", *args], cwd=repo_path, env=env, check=True, capture_output=True)
+
+    git("init", "-b", "main")
+    (repo_path / "main.py").write_text("def one():\n    return 1\n\n\ndef two():\n    return 2\n")
+    (repo_path / "notes.txt").write_text("notes\n")
+    git("add", "-A")
+    # the test database is shared by tests, the message makes the commit unique to this test
+    git("commit", "-m", f"add main.py to {tmp_path.name}")
+
+    yield str(repo_path)
+
+
+def _file_metrics_(session, repo):
+    shas = [commit.sha for commit in repo.commits]
+    query = select(CommittedFile.file_name, CommittedFile.n_lines_of_code, CommittedFile.n_methods)
+    return {
+        name: (nloc, n_methods)
+        for name, nloc, n_methods in session.execute(query.where(CommittedFile.commit_sha.in_(shas)))
+    }
+
+
+def test_code_metrics_policy():
+    assert wants_code_metrics("all", "py")
+    assert not wants_code_metrics("off", "py")
+    assert not wants_code_metrics("deferred", "py")
+    assert wants_code_metrics("java, py", "py")
+    assert not wants_code_metrics("java,py", "txt")
+    assert is_valid_policy("deferred") and is_valid_policy("java,py")
+    assert not is_valid_policy(" , ")
+
+
+def test_deferred_code_metrics(session, python_repo):
+    repo, n_commits = index_commits(
+        session, python_repo, local_repo_path=python_repo, repo_source="local", code_metrics="deferred"
+    )
+    assert n_commits == 1
+    assert _file_metrics_(session, repo) == {"main.py": (0, 0), "notes.txt": (0, 0)}
+    assert session.scalar(select(Commit.has_code_metrics).where(Commit.sha == repo.commits[0].sha)) is False
+
+    assert index_code_metrics(session, python_repo, local_repo_path=python_repo, repo_source="local") == 1
+    assert _file_metrics_(session, repo)["main.py"] == (4, 2)
+    assert session.scalar(select(Commit.has_code_metrics).where(Commit.sha == repo.commits[0].sha)) is True
+
+    # nothing left to do
+    assert index_code_metrics(session, python_repo, local_repo_path=python_repo, repo_source="local") == 0
+
+
+def test_code_metrics_for_file_types(session, python_repo):
+    repo, _ = index_commits(session, python_repo, local_repo_path=python_repo, repo_source="local", code_metrics="java")
+    assert _file_metrics_(session, repo)["main.py"] == (0, 0)
@@ -1,14 +1,24 @@
+import hashlib
 import random
+import shutil
 import string
-from datetime import datetime
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
 
 import git
+import pytest
+from pydriller.domain.commit import ModificationType
 from sqlalchemy import text
 
-from git_indexer.commit_indexer import index_commits
+from git_indexer import commit_indexer, gitlog
+from git_indexer.commit_indexer import ENGINES, index_commits
 from git_indexer.models import (
+    Commit,
+    IndexCheckpoint,
     ensure_repository,
     repo_commit_hashes,
+    repo_ref_tips,
     repo_to_commit_table,
 )
 
@@ -70,6 +80,165 @@ def test_index_local_repo(session, local_repo, mirror_parent_path):
     assert rows_after - rows_before == 5 + n_new_commits
 
 
+def test_index_fork_in_chunks(session, local_repo):
+    """
+    index repo1_fork after repo1 with a small batch size. the commits shared with repo1
+    are resolved in chunks and only linked, the new commit is created
+    """
+    repo1 = local_repo + "/repo1"
+    index_commits(session, repo1, local_repo_path=repo1, repo_source="local", batch_size=2)
+    n_commits_before = session.query(Commit).count()
+
+    repo1_fork = local_repo + "/repo1_fork"
+    repo_obj, n_commits = index_commits(
+        session, repo1_fork, local_repo_path=repo1_fork, repo_source="local", batch_size=2
+    )
+
+    assert n_commits == 3
+    assert len(repo_commit_hashes(repo_obj)) == 3
+    assert session.query(Commit).count() - n_commits_before <= 1
+
+
+def test_lookup_larger_chunk_in_parts(session, local_repo, mocker):
+    # a chunk larger than the lookup size is looked up with several queries
+    mocker.patch.object(commit_indexer, "_LOOKUP_SIZE_", 1)
+    repo1_fork = local_repo + "/repo1_fork"
+    repo_obj, _ = index_commits(session, repo1_fork, local_repo_path=repo1_fork, repo_source="local", index_all=True)
+
+    assert len(repo_commit_hashes(repo_obj)) == 3
+
+
+def test_index_branch_with_old_commits(session, local_repo, tmp_path, mocker):
+    """
+    a branch with commits older than the last indexed commit, e.g. a long lived
+    branch pushed late, is found by comparing ref tips instead of commit dates
+    """
+    repo_path = str(tmp_path / "repo1")
+    shutil.copytree(local_repo + "/repo1", repo_path)
+    repo_obj, _ = index_commits(session, repo_path, local_repo_path=repo_path, repo_source="local")
+    assert repo_ref_tips(repo_obj)["HEAD"] == git.Repo(repo_path).head.commit.hexsha
+
+    repo = git.Repo(repo_path)
+    repo.git.checkout("-b", "old_branch")
+    with open(repo_path + "/old.txt", "w") as f:
+        f.write("old content")
+    repo.git.add(A=True)
+    old_commit = repo.index.commit("old commit", commit_date="2020-01-01T00:00:00", author_date="2020-01-01T00:00:00")
+
+    repo_obj, n_commits = index_commits(session, repo_path, local_repo_path=repo_path, repo_source="local")
+    assert n_commits == 1
+    assert repo_ref_tips(repo_obj)["refs/heads/old_branch"] == old_commit.hexsha
+
+    # no ref moved, known commits are not even loaded
+    spy = mocker.spy(commit_indexer, "repo_commit_hashes")
+    _, n_commits = index_commits(session, repo_path, local_repo_path=repo_path, repo_source="local")
+    assert n_commits == 0
+    spy.assert_not_called()
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_resume_from_checkpoint(session, local_repo, tmp_path, mocker, engine):
+    """
+    a run interrupted after some batches are written is resumed
+    from the checkpoint, the commits before it are not traversed again
+    """
+    repo_path = str(tmp_path / "repo1")
+    shutil.copytree(local_repo + "/repo1", repo_path)
+    repo = git.Repo(repo_path)
+    for i in range(4):
+        with open(f"{repo_path}/file{i}.txt", "w") as f:
+            f.write(f"{engine} {i}")
+        repo.git.add(A=True)
+        repo.index.commit(f"commit {i}")
+
+    new_commit = commit_indexer._new_commit_
+
+    def interrupted(git_commit, *args):
+        if git_commit.msg == "commit 2":
+            raise RuntimeError("interrupted")
+        return new_commit(git_commit, *args)
+
+    mocker.patch.object(commit_indexer, "_new_commit_", side_effect=interrupted)
+    repo_obj, _ = index_commits(
+        session, repo_path, local_repo_path=repo_path, repo_source="local", batch_size=2, engine=engine
+    )
+    assert repo_obj is None
+
+    repo_obj = ensure_repository(session, repo_path, "local")
+    checkpoint = session.get(IndexCheckpoint, repo_obj.id)
+    assert checkpoint.n_done == 4
+    assert checkpoint.last_sha == repo.commit("HEAD~2").hexsha
+    assert repo_ref_tips(repo_obj) == {}
+
+    mocker.stopall()
+    spy = mocker.spy(commit_indexer, "_new_commit_")
+    repo_obj, n_commits = index_commits(
+        session, repo_path, local_repo_path=repo_path, repo_source="local", batch_size=2, engine=engine
+    )
+    assert n_commits == 2
+    assert [call.args[0].msg for call in spy.call_args_list] == ["commit 2", "commit 3"]
+    assert len(repo_commit_hashes(repo_obj)) == 6
+    assert session.get(IndexCheckpoint, repo_obj.id) is None
+    assert repo_ref_tips(repo_obj)["HEAD"] == repo.head.commit.hexsha
+
+
+def test_memory_stays_flat(session, tmp_path, mocker):
+    """
+    index 100k synthetic commits through the write path, memory used
+    once the first batches are written does not grow with the number of commits
+    """
+    repo_path = str(tmp_path / "synthetic")
+    git.Repo.init(repo_path).index.commit("root")
+
+    def synthetic_commits():
+        committer = gitlog.GitLogDeveloper(name="synthetic", email="synthetic@example.com")
+        for i in range(100_000):
+            mod = gitlog.GitLogModifiedFile(
+                ModificationType.MODIFY, f"src/file{i % 100}.py", f"src/file{i % 100}.py", 3, 1
+            )
+            yield gitlog.GitLogCommit(
+                hash=hashlib.sha1(f"{tmp_path}/{i}".encode()).hexdigest(),
+                parents=[],
+                committer=committer,
+                committer_date=datetime.fromtimestamp(1_600_000_000 + i, tz=timezone.utc),
+                msg=f"synthetic commit {i}",
+                insertions=3,
+                deletions=1,
+                files=1,
+                modified_files=[mod],
+            )
+
+    @contextmanager
+    def traverse_synthetic_commits(*args, **kwargs):
+        yield synthetic_commits()
+
+    mocker.patch.object(commit_indexer, "_traverse_commits_", side_effect=traverse_synthetic_commits)
+
+    write_chunk = commit_indexer._write_chunk_
+    memory_used = []
+
+    def write_chunk_and_measure(*args):
+        last_commit_at = write_chunk(*args)
+        memory_used.append(tracemalloc.get_traced_memory()[0])
+        return last_commit_at
+
+    # not a mock with side_effect, which would keep every chunk in its call_args_list
+    mocker.patch.object(commit_indexer, "_write_chunk_", new=write_chunk_and_measure)
+
+    tracemalloc.start()
+    try:
+        _, n_commits = index_commits(
+            session, repo_path, local_repo_path=repo_path, repo_source="local", batch_size=1000, engine="gitlog"
+        )
+    finally:
+        tracemalloc.stop()
+
+    assert n_commits == 100_000
+    assert len(memory_used) == 100
+    # allow for some noise, 100k commits kept in memory would be way above this
+    assert max(memory_used[10:]) - memory_used[10] < 2 * 2**20
+
+
 def test_index_empty_repo(session, local_repo, mirror_parent_path):
     """
     empty_repo is empty, no commit after git init.
@@ -81,6 +250,24 @@ def test_index_empty_repo(session, local_repo, mirror_parent_path):
     assert n_commits == 0
 
 
+@pytest.mark.parametrize("code_metrics, expected", [("off", "off"), ("deferred", "deferred"), ("java", "deferred")])
+def test_gitlog_engine_code_metrics(session, local_repo, mocker, code_metrics, expected):
+    # the gitlog engine does not compute code metrics, they are deferred unless turned off
+    extract_chunks = mocker.spy(commit_indexer, "_extract_chunks_")
+    repo1 = local_repo + "/repo1"
+    index_commits(
+        session,
+        repo1,
+        local_repo_path=repo1,
+        repo_source="local",
+        index_all=True,
+        engine="gitlog",
+        code_metrics=code_metrics,
+    )
+
+    assert extract_chunks.call_args.args[5] == expected
+
+
 def _add_random_commit_(repo_path: str):
     """create a few random commit into a local repo"""
     n_rand = random.randint(2, 6)
@@ -0,0 +1,93 @@
+import re
+
+import pytest
+
+from git_indexer.exclusions import (
+    DEFAULT_EXCLUDE_PATTERNS,
+    EXCLUDE_PATTERNS_FILE_ENV,
+    PathExcluder,
+    default_excluder,
+    load_patterns,
+)
+
+
+@pytest.fixture
+def reset_default_excluder():
+    default_excluder.cache_clear()
+    yield
+    default_excluder.cache_clear()
+
+
+def test_combined_regex_matches_like_separate_ones():
+    excluder = PathExcluder(DEFAULT_EXCLUDE_PATTERNS)
+    regexes = [re.compile(pattern) for pattern in DEFAULT_EXCLUDE_PATTERNS]
+    paths = [
+        "vendor/lib/x.go",
+        "app/Pods/Firebase.h",
+        "a/b/Pods/Firebase.h",
+        "App.xcodeproj/project.pbxproj",
+        "go.sum",
+        "web/package-lock.json",
+        "web/node_modules/x.js",
+        "node_modules.txt",
+        "styles/_mixins.scss",
+        "src/main/App.java",
+        "idea/misc.xml",
+    ]
+    for path in paths:
+        assert excluder.is_excluded(path) == any(regex.match(path) for regex in regexes), path
+
+
+def test_memoized_per_path():
+    excluder = PathExcluder([r".*\.lock$"], cache_size=2)
+    assert excluder.is_excluded("yarn.lock")
+    assert excluder.is_excluded("yarn.lock")
+    assert not excluder.is_excluded("src/main.py")
+
+    info = excluder.is_excluded.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 2, 2)
+
+
+def test_no_patterns():
+    assert not PathExcluder([]).is_excluded("vendor/lib/x.go")
+
+
+def test_patterns_from_file(tmp_path, monkeypatch, reset_default_excluder):
+    patterns_file = tmp_path / "exclude.txt"
+    patterns_file.write_text("# generated code\n^gen/\n\n.*\\.pb\\.go$\n")
+    assert load_patterns(str(patterns_file)) == ["^gen/", r".*\.pb\.go$"]
+
+    monkeypatch.setenv(EXCLUDE_PATTERNS_FILE_ENV, str(patterns_file))
+    excluder = default_excluder()
+    assert excluder.is_excluded("gen/api.py")
+    assert excluder.is_excluded("api/service.pb.go")
+    # the file replaces the default patterns
+    assert not excluder.is_excluded("vendor/lib/x.go")
+
+
+def test_invalid_pattern_in_file(tmp_path):
+    patterns_file = tmp_path / "exclude.txt"
+    patterns_file.write_text("^gen/\n(unclosed\n")
+    with pytest.raises(re.error):
+        load_patterns(str(patterns_file))
+
+
+def test_inline_flags_scoped_to_pattern():
+    excluder = PathExcluder(["^gen/", "(?i)^vendor/"])
+    assert excluder.is_excluded("Vendor/lib/x.go")
+    assert not excluder.is_excluded("GEN/api.py")
+
+
+@pytest.mark.parametrize(
+    "lines",
+    [
+        "^gen/\nsrc/(?i)vendor/\n",  # flags not at the start
+        "^gen/\n(a)/\\1/\n",  # numbered backreference
+        "(?P<dir>gen)/\n(?P<dir>out)/\n",  # same group name in two patterns
+    ],
+)
+def test_patterns_not_combinable(tmp_path, lines):
+    patterns_file = tmp_path / "exclude.txt"
+    patterns_file.write_text(lines)
+    with pytest.raises(re.error, match=re.escape(str(patterns_file))):
+        load_patterns(str(patterns_file))
@@ -4,6 +4,7 @@ from git_indexer.models import (
     Repository,
     ensure_repository,
     repo_commit_hashes,
+    sha_digest,
 )
 
 
@@ -51,3 +52,5 @@ def test_repo_commit_hashes(session):
 
     hashes = repo_commit_hashes(repo)
     assert len(hashes) == 2
+    assert sha_digest("feb3a2837630c0e51447fc1d7e68d86f964a8440") in hashes
+    assert sha_digest("e2c8b79813b95c93e5b06c5a82e4c417d5020762") not in hashes
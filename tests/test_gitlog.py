@@ -0,0 +1,125 @@
+import os
+import subprocess
+from datetime import datetime, timezone
+
+import pytest
+from pydriller import Git
+
+from git_indexer import gitlog
+from git_indexer.commit_indexer import index_commits
+from git_indexer.models import repo_commit_hashes
+
+
+@pytest.fixture
+def edge_case_repo(tmp_path):
+    """a repo with renames, binary files, mode and type changes, merges and empty commits"""
+    repo_path = tmp_path / "edge_case_repo"
+    repo_path.mkdir()
+    env = dict(
+        os.environ,
+        GIT_AUTHOR_NAME="Ann",
+        GIT_AUTHOR_EMAIL="Ann@Example.com",
+        GIT_COMMITTER_NAME="Chloé",
+        GIT_COMMITTER_EMAIL="Chloe@Example.com",
+        GIT_COMMITTER_DATE="2023-07-07T15:59:06+08:00",
+    )
+
+    def git(*args):
+        subprocess.run(["git", *args], cwd=repo_path, env=env, check=True, capture_output=True)
+
+    def write(path, content):
+        (repo_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (repo_path / path).write_bytes(content)
+
+    git("init", "-b", "main")
+    write("a.txt", b"a\nb\nc\n")
+    write("big.txt", b"".join(b"line%d\n" % i for i in range(10)))
+    git("add", "-A")
+    git("commit", "-m", "root commit\n\nwith a body")
+
+    write("a.txt", b"a\nB\nc\nd\r\n")
+    write("logo.png", bytes(range(256)))
+    git("add", "-A")
+    git("commit", "-m", "modify and add binary")
+
+    git("mv", "big.txt", "moved.txt")
+    write("moved.txt", b"".join(b"line%d\n" % i for i in range(11)))
+    git("add", "-A")
+    git("commit", "-m", "rename")
+
+    os.chmod(repo_path / "a.txt", 0o755)
+    git("add", "-A")
+    git("commit", "-m", "change mode")
+
+    git("checkout", "-b", "feature")
+    write("feature/f.txt", b"f\n")
+    git("add", "-A")
+    git("commit", "-m", "feature")
+    git("checkout", "main")
+    git("rm", "logo.png")
+    write("dir with space/ünï.txt", b"u\n")
+    git("add", "-A")
+    git("commit", "-m", "delete and unicode path")
+    git("merge", "--no-ff", "feature", "-m", "merge feature")
+
+    git("commit", "--allow-empty", "-m", "empty")
+    os.symlink("a.txt", repo_path / "link")
+    git("add", "-A")
+    git("commit", "-m", "symlink")
+    os.remove(repo_path / "link")
+    write("link", b"not a link\n")
+    git("add", "-A")
+    git("commit", "-m", "type change")
+    git("tag", "-a", "v1", "-m", "v1")
+
+    yield str(repo_path)
+
+
+def _commit_fields_(git_commit):
+    # the fields stored in gi_commits and gi_committed_files, except code metrics
+    return (
+        git_commit.hash,
+        git_commit.msg,
+        git_commit.committer.name,
+        git_commit.committer.email,
+        git_commit.merge,
+        git_commit.lines,
+        git_commit.files,
+        git_commit.insertions,
+        git_commit.deletions,
+        git_commit.committer_date,
+        [
+            (
+                mod.change_type,
+                mod.new_path or mod.old_path,
+                mod.filename,
+                mod.added_lines,
+                mod.deleted_lines,
+            )
+            for mod in git_commit.modified_files
+        ],
+    )
+
+
+@pytest.mark.parametrize("repo_name", ["edge_case_repo", "repo1", "repo1_fork"])
+def test_gitlog_matches_pydriller(repo_name, edge_case_repo, local_repo):
+    repo_path = edge_case_repo if repo_name == "edge_case_repo" else f"{local_repo}/{repo_name}"
+    since = datetime.min.replace(tzinfo=timezone.utc)
+
+    git_repo = Git(repo_path)
+    expected = [_commit_fields_(c) for c in git_repo.get_list_commits("HEAD", all=True, remotes=True, since=since)]
+    git_repo.clear()
+
+    rev_args = ["--all", "--remotes", f"--since={since}", "--reverse", "HEAD"]
+    actual = [_commit_fields_(c) for c in gitlog.traverse_commits(repo_path, rev_args)]
+
+    assert len(actual) > 0
+    assert actual == expected
+
+
+def test_index_with_gitlog_engine(session, edge_case_repo):
+    repo, n_commits = index_commits(
+        session, edge_case_repo, local_repo_path=edge_case_repo, repo_source="local", engine="gitlog"
+    )
+    assert n_commits == 10
+    assert len(repo_commit_hashes(repo)) == 10
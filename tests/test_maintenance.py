@@ -0,0 +1,42 @@
+import os
+import shlex
+import shutil
+
+import git
+
+from git_indexer.cli import main
+from git_indexer.maintenance import count_packs, is_maintenance_due, maintain_mirror
+from git_indexer.mirror import mirror_repo
+
+
+def test_maintain_mirror(local_repo, tmp_path):
+    source_path = str(tmp_path / "repo1")
+    shutil.copytree(local_repo + "/repo1", source_path)
+    mirror_path, _ = mirror_repo(source_path, "local", False, str(tmp_path / "mirror"))
+    # a pack per fetch, like a mirror updated many times
+    source = git.Repo(source_path)
+    for i in range(3):
+        source.index.commit(f"empty commit {i}")
+        mirror_repo(source_path, "local", False, str(tmp_path / "mirror"))
+        git.Repo(mirror_path).git.repack("-q")
+    assert count_packs(mirror_path) > 2
+    assert is_maintenance_due(mirror_path)
+
+    report = maintain_mirror(mirror_path, max_packs=2)
+
+    assert report.steps == ["repack", "commit-graph"]
+    assert report.packs_after == 1
+    assert os.path.isfile(f"{mirror_path}/objects/info/commit-graph")
+    assert not is_maintenance_due(mirror_path)
+    assert is_maintenance_due(mirror_path, interval_days=0)
+
+
+def test_maintain_mode(local_repo, tmp_path, sql_engine):
+    list_file = tmp_path / "mirror.lst"
+    list_file.write_text(f"{local_repo}/repo1,n,file\n")
+    mirror_path = tmp_path / "mirror"
+
+    main(argv=shlex.split(f"--mode mirror --source list --query {list_file} --mirror_path {mirror_path}"))
+    main(argv=shlex.split(f"--mode maintain --source list --query {list_file} --mirror_path {mirror_path}"))
+
+    assert len(list(mirror_path.glob("**/objects/info/commit-graph"))) == 1
@@ -0,0 +1,76 @@
+import shlex
+import urllib.request
+
+from git_indexer import metrics
+from git_indexer.cli import main
+from git_indexer.metrics import Registry, serve_metrics
+
+
+def test_render():
+    registry = Registry()
+    errors = registry.counter("test_errors_total", "errors", ("stage", "type"))
+    errors.inc(stage="index", type="DatabaseError")
+    errors.inc(2, stage="mirror", type='Say "what"')
+    duration = registry.histogram("test_seconds", "duration")
+    duration.observe(0.02)
+    duration.observe(7)
+    registry.gauge("test_backlog", "backlog").set(3)
+
+    text = registry.render()
+    assert "# TYPE test_errors_total counter" in text
+    assert 'test_errors_total{stage="index",type="DatabaseError"} 1\n' in text
+    assert 'test_errors_total{stage="mirror",type="Say \\"what\\""} 2\n' in text
+    assert 'test_seconds_bucket{le="0.01"} 0\n' in text
+    assert 'test_seconds_bucket{le="0.05"} 1\n' in text
+    assert 'test_seconds_bucket{le="10"} 2\n' in text
+    assert 'test_seconds_bucket{le="+Inf"} 2\n' in text
+    assert "test_seconds_sum 7.02\n" in text
+    assert "test_seconds_count 2\n" in text
+    assert "test_backlog 3\n" in text
+
+
+def test_take_values_and_merge():
+    # e.g. the registry of a worker process and that of the parent
+    worker, parent = Registry(), Registry()
+    for registry in [worker, parent]:
+        registry.counter("test_commits_total", "commits")
+        registry.histogram("test_seconds", "duration")
+
+    worker.metrics["test_commits_total"].inc(5)
+    worker.metrics["test_seconds"].observe(1)
+    parent.merge(worker.take_values())
+    worker.metrics["test_commits_total"].inc(2)
+    parent.merge(worker.take_values())
+
+    assert parent.metrics["test_commits_total"].total() == 7
+    assert parent.metrics["test_seconds"].total() == 1
+    assert worker.metrics["test_commits_total"].total() == 0
+
+
+def test_serve_metrics():
+    server = serve_metrics(0, host="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert response.status == 200
+            assert b"# TYPE git_indexer_commits_indexed_total counter" in response.read()
+    finally:
+        server.shutdown()
+
+
+def test_metrics_file(tmp_path, local_repo, sql_engine):
+    list_file = tmp_path / "local.lst"
+    list_file.write_text(f"{local_repo}/repo1\n")
+    metrics_file = tmp_path / "indexer.prom"
+    n_commits = metrics.COMMITS_INDEXED.total()
+
+    argv = shlex.split(
+        f"--mode commits --source list --query {list_file} --mirror_path {tmp_path} --metrics_file {metrics_file}"
+    )
+    main(argv=argv)
+
+    assert metrics.COMMITS_INDEXED.total() > n_commits
+    text = metrics_file.read_text()
+    assert f"git_indexer_commits_indexed_total {metrics.COMMITS_INDEXED.total():.0f}\n" in text
+    assert "git_indexer_batch_write_seconds_count" in text
+    assert "git_indexer_incomplete_repos 0\n" in text
@@ -1,8 +1,11 @@
 import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 import git
 import pytest
 
+import git_indexer.mirror
 from git_indexer.mirror import mirror_repo, update_remote_url
 
 
@@ -31,6 +34,95 @@ def test_mirror_repo(tmp_path):
     assert os.path.isfile(mirror_path + "/HEAD")
 
 
+def test_mirror_repos_in_threads(local_repo, tmp_path):
+    source_paths = []
+    for i in range(4):
+        source_paths.append(str(tmp_path / f"source{i}" / "repo1"))
+        shutil.copytree(local_repo + "/repo1", source_paths[-1])
+    mirror_parent = str(tmp_path / "mirror")
+    cwd = os.getcwd()
+
+    def mirror_all():
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            return list(executor.map(lambda path: mirror_repo(path, "local", False, mirror_parent), source_paths))
+
+    results = mirror_all()
+    assert os.getcwd() == cwd
+    assert all(os.path.isfile(mirror_path + "/HEAD") for mirror_path, _ in results)
+    assert len({mirror_path for mirror_path, _ in results}) == 4
+    assert all(is_new for _, is_new in results)
+
+    # second round fetches into the existing mirrors
+    assert [is_new for _, is_new in mirror_all()] == [False] * 4
+    assert os.getcwd() == cwd
+
+
+def test_mirror_refs(local_repo, tmp_path):
+    source_path = str(tmp_path / "repo1")
+    shutil.copytree(local_repo + "/repo1", source_path)
+    source = git.Repo(source_path)
+    source.git.update_ref("refs/pull/1/head", "HEAD")
+    source.git.update_ref("refs/merge-requests/2/head", "HEAD")
+
+    def mirrored_refs(mirror_path):
+        return git.Repo(mirror_path).git.for_each_ref("--format=%(refname)").splitlines()
+
+    mirror_path, _ = mirror_repo(source_path, "local", False, str(tmp_path / "all"))
+    assert "refs/pull/1/head" in mirrored_refs(mirror_path)
+
+    # policy applied to an existing mirror
+    mirror_path, is_new = mirror_repo(source_path, "local", False, str(tmp_path / "all"), refs="branches")
+    assert not is_new
+    assert not any(ref.startswith(("refs/pull/", "refs/merge-requests/")) for ref in mirrored_refs(mirror_path))
+    assert "refs/heads/master" in mirrored_refs(mirror_path) or "refs/heads/main" in mirrored_refs(mirror_path)
+
+    # new mirror
+    mirror_path, is_new = mirror_repo(source_path, "local", False, str(tmp_path / "branches"), refs="branches")
+    assert is_new
+    assert not any(ref.startswith(("refs/pull/", "refs/merge-requests/")) for ref in mirrored_refs(mirror_path))
+    fetch = git.Repo(mirror_path).git.config("--get-all", "remote.origin.fetch").splitlines()
+    assert fetch == ["+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"]
+
+    source.git.tag("v_new")
+    _, is_new = mirror_repo(source_path, "local", False, str(tmp_path / "branches"), refs="branches")
+    assert not is_new
+    assert "refs/tags/v_new" in mirrored_refs(mirror_path)
+
+
+def test_mirror_repo_precheck(local_repo, tmp_path, mocker):
+    source_path = str(tmp_path / "repo1")
+    shutil.copytree(local_repo + "/repo1", source_path)
+    mirror_parent = str(tmp_path / "mirror")
+    # the clone records the refs advertised
+    mirror_repo(source_path, "local", False, mirror_parent)
+
+    run = mocker.spy(git_indexer.mirror, "run")
+    mirror_path, is_new = mirror_repo(source_path, "local", False, mirror_parent)
+    assert mirror_path and not is_new
+    run.assert_not_called()
+
+    mirror_repo(source_path, "local", False, mirror_parent, precheck=False)
+    assert run.call_count == 1
+
+    git.Repo(source_path).git.tag("v_new")
+    mirror_repo(source_path, "local", False, mirror_parent)
+    assert run.call_count == 2
+    assert "v_new" in git.Repo(mirror_path).git.tag().splitlines()
+
+
+def test_mirror_repo_retries(mocker):
+    attempts = mocker.patch(
+        "git_indexer.mirror._mirror_repo_",
+        side_effect=[(None, False), (None, False), ("/mirror/repo.git", True)],
+    )
+
+    result = mirror_repo("https://gitlab.com/group/repo.git", "gitlab", False, "/mirror", retries=2, backoff_seconds=0)
+    assert result == ("/mirror/repo.git", True)
+    assert attempts.call_count == 3
+    # retries overwrite what a failed clone left behind
+    assert attempts.call_args.kwargs["overwrite"] is True
+
+
 def test_update_remote_url(local_repo):
     old_gitlab_token = os.environ.get("GITLAB_TOKEN")
     os.environ["GITLAB_TOKEN"] = "fake_token"
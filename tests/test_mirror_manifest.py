@@ -0,0 +1,59 @@
+import shlex
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+
+from git_indexer.cli import main
+from git_indexer.mirror_manifest import evict_mirrors
+from git_indexer.models import Mirror, Repository
+
+
+def test_manifest_updated_by_run(local_repo, tmp_path, session):
+    list_file = tmp_path / "mirror.lst"
+    list_file.write_text(f"{local_repo}/repo1,n,file\n")
+    mirror_path = tmp_path / "mirror"
+
+    main(argv=shlex.split(f"--mode mirror --source list --query {list_file} --mirror_path {mirror_path}"))
+
+    mirror = session.scalar(select(Mirror).where(Mirror.clone_url == f"{local_repo}/repo1"))
+    assert mirror.path.startswith(str(mirror_path))
+    assert mirror.size_bytes > 0
+    assert mirror.last_fetched_at is not None
+
+
+def test_evict_mirrors(tmp_path, session):
+    session.execute(delete(Mirror))
+    now = datetime.utcnow()
+
+    mirror_root = tmp_path / "mirror"
+
+    def add_mirror(name, size_bytes, last_fetched_at, is_active=None, parent=mirror_root):
+        clone_url = f"https://gitlab.com/evict/{tmp_path.name}/{name}.git"
+        path = parent / f"{name}.git"
+        path.mkdir(parents=True)
+        session.add(Mirror(clone_url=clone_url, path=str(path), size_bytes=size_bytes, last_fetched_at=last_fetched_at))
+        if is_active is not None:
+            session.add(Repository(clone_url=clone_url, is_active=is_active))
+        return clone_url
+
+    old = add_mirror("old", 100, now - timedelta(days=30))
+    recent = add_mirror("recent", 100, now - timedelta(days=1), is_active=True)
+    inactive = add_mirror("inactive", 100, now)
+    session.add(Repository(clone_url=inactive, is_active=False))
+    # one active row among several with the same clone url keeps the mirror active, and counted once
+    session.add(Repository(clone_url=recent, is_active=False))
+    session.commit()
+
+    assert evict_mirrors(session, 300, str(mirror_root)) == []
+    assert evict_mirrors(session, 150, str(mirror_root)) == [inactive, old]
+
+    assert list(session.scalars(select(Mirror.clone_url))) == [recent]
+    assert not (mirror_root / "old.git").exists()
+    assert (mirror_root / "recent.git").exists()
+
+    # a mirror outside of the mirror root, e.g. from a run with another --mirror_path, is never deleted
+    elsewhere = add_mirror("elsewhere", 100, now - timedelta(days=60), parent=tmp_path / "elsewhere")
+    session.commit()
+    assert evict_mirrors(session, 150, str(mirror_root)) == [elsewhere]
+    assert (tmp_path / "elsewhere" / "elsewhere.git").exists()
+    assert list(session.scalars(select(Mirror.clone_url))) == [recent]
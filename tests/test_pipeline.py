@@ -0,0 +1,74 @@
+import shutil
+import threading
+
+import pytest
+
+from git_indexer.commit_indexer import ENGINES, index_commits
+from git_indexer.models import repo_commit_hashes
+from git_indexer.pipeline import run_pipeline
+
+
+def test_pipeline_backpressure():
+    produced, consumed = [], []
+    max_ahead = 0
+
+    def items():
+        for i in range(20):
+            produced.append(i)
+            yield i
+
+    def consume(item):
+        nonlocal max_ahead
+        max_ahead = max(max_ahead, len(produced) - len(consumed))
+        consumed.append(item)
+
+    stats = run_pipeline(items(), consume, queue_size=2)
+
+    assert consumed == list(range(20))
+    assert stats.n_items == 20
+    # at most queue_size items waiting, plus the one being put and the one being consumed
+    assert max_ahead <= 4
+
+
+def test_pipeline_producer_error():
+    def items():
+        yield 1
+        raise ValueError("bad commit")
+
+    consumed = []
+    with pytest.raises(ValueError, match="bad commit"):
+        run_pipeline(items(), consumed.append)
+    assert consumed == [1]
+
+
+def test_pipeline_consumer_error_stops_producer():
+    closed = threading.Event()
+
+    def items():
+        try:
+            i = 0
+            while True:
+                yield i
+                i += 1
+        finally:
+            closed.set()
+
+    def consume(item):
+        if item == 3:
+            raise RuntimeError("database is down")
+
+    with pytest.raises(RuntimeError, match="database is down"):
+        run_pipeline(items(), consume, queue_size=1)
+    assert closed.is_set()
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_index_with_pipeline(session, local_repo, tmp_path, engine):
+    repo_path = str(tmp_path / "repo1_fork")
+    shutil.copytree(local_repo + "/repo1_fork", repo_path)
+
+    repo, n_commits = index_commits(
+        session, repo_path, local_repo_path=repo_path, repo_source="local", batch_size=1, engine=engine, pipeline=True
+    )
+    assert n_commits == 3
+    assert len(repo_commit_hashes(repo)) == 3
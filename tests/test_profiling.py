@@ -0,0 +1,49 @@
+import shlex
+import time
+
+from git_indexer.cli import main
+from git_indexer.profiling import RepoProfile, profile_file_name, timed
+
+
+def test_nested_stages_are_exclusive():
+    profile = RepoProfile("repo")
+    with profile.stage("write"):
+        time.sleep(0.02)
+        with profile.stage("authors"):
+            time.sleep(0.05)
+
+    assert profile.timings["authors"] >= 0.05
+    assert 0.02 <= profile.timings["write"] < 0.05
+    assert profile.total >= 0.07
+
+
+def test_iterate():
+    def items():
+        for i in range(3):
+            time.sleep(0.01)
+            yield i
+
+    profile = RepoProfile("repo")
+    assert list(profile.iterate("traverse", items())) == [0, 1, 2]
+    assert profile.timings["traverse"] >= 0.03
+
+
+def test_timed():
+    assert [item for item, _ in timed(iter([1, 2]))] == [1, 2]
+
+
+def test_profile_file_name():
+    assert profile_file_name("https://gitlab.com/group/project/repo.git") == "group_project_repo.prof"
+
+
+def test_index_with_profile(tmp_path, local_repo, sql_engine):
+    list_file = tmp_path / "local.lst"
+    list_file.write_text(f"{local_repo}/repo1\n")
+    profile_dir = tmp_path / "profiles"
+
+    argv = shlex.split(
+        f"--mode commits --source list --query {list_file} --mirror_path {tmp_path} --profile_dir {profile_dir}"
+    )
+    main(argv=argv)
+
+    assert [path.suffix for path in profile_dir.iterdir()] == [".prof"]
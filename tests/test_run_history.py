@@ -0,0 +1,62 @@
+import shlex
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import git_indexer.cli
+from git_indexer.cli import main
+from git_indexer.models import IndexRun, IndexRunRepo
+
+
+def test_run_is_recorded(tmp_path, local_repo, sql_engine, capsys):
+    repo_url = f"{local_repo}/repo1"
+    list_file = tmp_path / "local.lst"
+    list_file.write_text(f"{repo_url}\n")
+
+    main(argv=shlex.split(f"--mode commits --source list --query {list_file} --mirror_path {tmp_path} --all"))
+
+    with Session(sql_engine) as session:
+        run = session.scalars(select(IndexRun).order_by(IndexRun.id.desc()).limit(1)).one()
+        assert run.mode == "commits"
+        assert run.outcome == "completed"
+        assert run.n_repos == 1
+        assert run.n_failed == 0
+        assert run.finished_at is not None
+
+        run_repo = session.scalars(select(IndexRunRepo).where(IndexRunRepo.run_id == run.id)).one()
+        assert run_repo.clone_url == repo_url
+        assert run_repo.repo_id is not None
+        assert run_repo.outcome in ["indexed", "skipped"]
+        assert run_repo.duration > 0
+        assert run_repo.error is None
+
+    main(argv=shlex.split("--mode report --report_days 1"))
+    out = capsys.readouterr().out
+    assert "slowest repositories" in out
+    assert "fastest growing repositories" in out
+    assert "repo1" in out
+
+
+def test_failed_repo_is_recorded(tmp_path, local_repo, sql_engine, mocker):
+    list_file = tmp_path / "local.lst"
+    list_file.write_text(f"{local_repo}/repo1\n{local_repo}/repo1_fork\n")
+    index_commits = git_indexer.cli.index_commits
+
+    def fail_repo1(session, repo_url, **kwargs):
+        if repo_url.endswith("/repo1"):
+            raise RuntimeError("boom")
+        return index_commits(session, repo_url, **kwargs)
+
+    mocker.patch("git_indexer.cli.index_commits", side_effect=fail_repo1)
+
+    main(argv=shlex.split(f"--mode commits --source list --query {list_file} --mirror_path {tmp_path}"))
+
+    with Session(sql_engine) as session:
+        run = session.scalars(select(IndexRun).order_by(IndexRun.id.desc()).limit(1)).one()
+        assert run.outcome == "completed"
+        assert run.n_repos == 2
+        assert run.n_failed == 1
+
+        run_repos = session.scalars(select(IndexRunRepo).where(IndexRunRepo.run_id == run.id)).all()
+        assert run_repos[0].outcome == "failed" and run_repos[1].outcome != "failed"
+        assert run_repos[0].error == "RuntimeError: boom"
@@ -0,0 +1,33 @@
+import shlex
+
+import git
+
+from git_indexer.cli import main
+from git_indexer.shared_objects import alternates_of, is_shared
+
+
+def test_maintain_with_shared_objects(local_repo, tmp_path, sql_engine):
+    list_file = tmp_path / "forks.lst"
+    list_file.write_text(f"{local_repo}/repo1,n,file\n{local_repo}/repo1_fork,n,file\n")
+    mirror_path = tmp_path / "mirror"
+
+    main(argv=shlex.split(f"--mode commits --source list --query {list_file} --mirror_path {mirror_path}"))
+    mirrors = sorted(str(head.parent) for head in mirror_path.glob("**/HEAD"))
+    n_commits = [git.Repo(path).git.rev_list("--all", "--count") for path in mirrors]
+
+    argv = f"--mode maintain --source list --query {list_file} --mirror_path {mirror_path} --shared_objects"
+    main(argv=shlex.split(argv))
+
+    # one of them borrows from the other, whichever was indexed first
+    borrowers = [path for path in mirrors if alternates_of(path)]
+    assert len(borrowers) == 1
+    (origin,) = set(mirrors) - set(borrowers)
+    assert alternates_of(borrowers[0]) == [f"{origin}/objects"]
+    assert is_shared(origin)
+    # same commits, no object missing
+    assert [git.Repo(path).git.rev_list("--all", "--count") for path in mirrors] == n_commits
+    git.Repo(borrowers[0]).git.fsck("--connectivity-only")
+
+    # running again changes nothing
+    main(argv=shlex.split(argv))
+    assert [path for path in mirrors if alternates_of(path)] == borrowers
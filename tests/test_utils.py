@@ -1,6 +1,8 @@
 import os
+from types import SimpleNamespace
 
 import pytest
+from gitlab.base import RESTObjectList
 
 from git_indexer.utils import (
     clone_url2mirror_path,
@@ -138,6 +140,31 @@ def test_enumerate_gitlab_repos():
     assert list(repos)[0][1].visibility is not None
 
 
+def test_enumerate_gitlab_repos_by_page(mocker):
+    def project(project_id):
+        return SimpleNamespace(id=project_id, http_url_to_repo=f"https://gitlab.com/group/repo{project_id}.git")
+
+    def list_projects(page=1, iterator=False, **kwargs):
+        projects = [project(page * 10 + i) for i in range(2)]
+        if iterator:
+            # iterating past the first page would fetch the next one
+            return mocker.MagicMock(
+                spec=RESTObjectList, total_pages=3, per_page=2, __iter__=lambda _: iter(projects + [project(99)])
+            )
+        return projects
+
+    gl = mocker.patch("git_indexer.utils.Gitlab").return_value
+    gl.projects.list.side_effect = list_projects
+
+    repos = list(enumerate_gitlab_repos("group", private_token="token"))
+
+    assert [clone_url for clone_url, _ in repos] == [
+        f"https://gitlab.com/group/repo{project_id}.git" for project_id in [10, 11, 20, 21, 30, 31]
+    ]
+    assert gl.projects.list.call_count == 3
+    gl.projects.get.assert_not_called()
+
+
 @pytest.mark.skipif(os.environ.get("OFFLINE_MODE") == "1", reason="running in offline mode")
 def test_enumerate_github_repos():
     repos = list(enumerate_github_repos("sloppycoder/hello"))
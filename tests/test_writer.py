@@ -0,0 +1,33 @@
+from datetime import datetime, timezone
+
+from git_indexer.models import Author, Commit, CommittedFile, ensure_repository
+from git_indexer.writer import BatchWriter
+
+
+def test_batch_writer(session):
+    repo = ensure_repository(session, "https://gitlab.com/dummy/batch.git", "gitlab")
+    author = session.query(Author).filter_by(email="mini@me").first()
+    now = datetime.now(timezone.utc)
+
+    shas = ["b1" * 20, "b2" * 20, "b3" * 20]
+    writer = BatchWriter(session, batch_size=2)
+    for sha in shas:
+        commit_row = {
+            "sha": sha,
+            "author_id": author.id,
+            "created_at": now.replace(tzinfo=None),
+            "created_at_tz": now,
+        }
+        file_row = {"commit_sha": sha, "file_path": "README.md", "file_name": "README.md", "file_type": "md"}
+        writer.add_commit(commit_row, [file_row])
+        writer.add_link(repo.id, sha)
+
+    # 2 commits are written when the batch is full, the 3rd one is still in the buffer
+    assert writer.pending == 1
+    assert session.query(Commit).filter(Commit.sha.in_(shas)).count() == 2
+
+    writer.flush()
+    assert writer.pending == 0
+    assert writer.n_rows_written == 9
+    assert session.query(CommittedFile).filter_by(commit_sha="b3" * 20).count() == 1
+    assert len(repo.commits) == 3